@@ -1,32 +1,18 @@
 
 import sys
 import json
-import re
 
-# Import the logic from the existing file.
+# Import the rewrite logic from humanize_core, which has no Streamlit
+# dependency and only loads NLTK/spaCy when text is actually rewritten.
 # We wrap this in a try-except block in case of import errors, 
 # although we expect the environment to be set up correctly.
 try:
-    from humanize_text import (
-        extract_citations,
-        restore_citations,
-        preserve_linebreaks_rewrite,
-        minimal_rewriting,
-        count_words,
-        count_sentences
-    )
+    from humanize_core import humanize, count_words, count_sentences
 except ImportError:
     # If standard import fails (e.g. not in path), try adding current dir
     import os
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from humanize_text import (
-        extract_citations,
-        restore_citations,
-        preserve_linebreaks_rewrite,
-        minimal_rewriting,
-        count_words,
-        count_sentences
-    )
+    from humanize_core import humanize, count_words, count_sentences
 
 def main():
     try:
@@ -51,24 +37,9 @@ def main():
         orig_wc = count_words(text)
         orig_sc = count_sentences(text)
 
-        # Protect citations
-        no_refs_text, placeholders = extract_citations(text)
-
-        # Rewrite
-        if preserve_linebreaks:
-            rewritten = preserve_linebreaks_rewrite(no_refs_text, p_syn=p_syn, p_trans=p_trans)
-        else:
-            rewritten = minimal_rewriting(no_refs_text, p_syn=p_syn, p_trans=p_trans)
-
-        # Restore citations and cleanup
-        final_text = restore_citations(rewritten, placeholders)
-        
-        # Cleanup logic matching the prompt/original file
-        final_text = re.sub(r"[ \t]+([.,;:!?])", r"\1", final_text)
-        final_text = re.sub(r"(\()[ \t]+", r"\1", final_text)
-        final_text = re.sub(r"[ \t]+(\))", r"\1", final_text)
-        final_text = re.sub(r"[ \t]{2,}", " ", final_text)
-        final_text = re.sub(r"``\s*(.+?)\s*''", r'"\1"', final_text)
+        # Protect citations, rewrite, restore citations and cleanup
+        final_text = humanize(text, p_syn=p_syn, p_trans=p_trans,
+                              preserve_linebreaks=preserve_linebreaks)
 
         new_wc = count_words(final_text)
         new_sc = count_sentences(final_text)
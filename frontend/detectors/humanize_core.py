@@ -0,0 +1,351 @@
+import random
+import re
+import warnings
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+# Core rewrite logic of the humanizer, free of Streamlit and of import-time
+# side effects: NLTK and spaCy are imported and loaded on first use, and
+# missing resources raise instead of being downloaded.
+# Install them once with ./setup.sh.
+
+SPACY_MODEL = "en_core_web_sm"
+
+# (resource path, download name). sent_tokenize needs punkt_tab; the legacy
+# punkt pickles are not a substitute.
+NLTK_RESOURCES = [
+    ("tokenizers/punkt_tab", "punkt_tab"),
+    ("corpora/wordnet", "wordnet"),
+]
+
+
+class MissingResourceError(LookupError):
+    pass
+
+
+########################################
+# Lazy NLP resources
+########################################
+_nltk_checked = False
+_nlp = None
+
+
+def nltk_modules():
+    """
+    Import NLTK's tokenizers and WordNet, checking once that their data is
+    installed locally.
+    """
+    global _nltk_checked
+    import nltk
+    from nltk.corpus import wordnet
+    from nltk.tokenize import sent_tokenize, word_tokenize
+
+    if not _nltk_checked:
+        missing = []
+        for path, name in NLTK_RESOURCES:
+            if not _nltk_has(nltk, path):
+                missing.append(name)
+        if missing:
+            raise MissingResourceError(
+                f"NLTK data not installed: {', '.join(missing)}. "
+                f"Install with: python -m nltk.downloader {' '.join(missing)}"
+            )
+        _nltk_checked = True
+
+    return sent_tokenize, word_tokenize, wordnet
+
+
+def _nltk_has(nltk, path):
+    try:
+        nltk.data.find(path)
+        return True
+    except LookupError:
+        return False
+
+
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        import spacy
+        try:
+            # Only the tagger is needed for part-of-speech based synonyms
+            _nlp = spacy.load(SPACY_MODEL, disable=["parser", "ner", "lemmatizer"])
+        except OSError:
+            raise MissingResourceError(
+                f"spaCy model {SPACY_MODEL} not installed. "
+                f"Install with: python -m spacy download {SPACY_MODEL}"
+            )
+    return _nlp
+
+
+########################################
+# Citation Regex
+########################################
+CITATION_REGEX = re.compile(
+    r"\(\s*[A-Za-z&\-,\.\s]+(?:et al\.\s*)?,\s*\d{4}(?:,\s*(?:pp?\.\s*\d+(?:-\d+)?))?\s*\)"
+)
+
+########################################
+# Helper: Word & Sentence Counts
+########################################
+def count_words(text):
+    _, word_tokenize, _ = nltk_modules()
+    return len(word_tokenize(text))
+
+def count_sentences(text):
+    sent_tokenize, _, _ = nltk_modules()
+    return len(sent_tokenize(text))
+
+########################################
+# Step 1: Extract & Restore Citations
+########################################
+def extract_citations(text):
+    refs = CITATION_REGEX.findall(text)
+    placeholder_map = {}
+    replaced_text = text
+    for i, r in enumerate(refs, start=1):
+        placeholder = f"[[REF_{i}]]"
+        placeholder_map[placeholder] = r
+        replaced_text = replaced_text.replace(r, placeholder, 1)
+    return replaced_text, placeholder_map
+
+PLACEHOLDER_REGEX = re.compile(r"\[\s*\[\s*REF_(\d+)\s*\]\s*\]")
+
+
+def restore_citations(text, placeholder_map):
+
+    def replace_placeholder(match):
+        # match.group(1) contains the numeric index captured from the placeholder
+        idx = match.group(1)
+        key = f"[[REF_{idx}]]"
+        return placeholder_map.get(key, match.group(0))
+
+    restored = PLACEHOLDER_REGEX.sub(replace_placeholder, text)
+    return restored
+
+
+########################################
+# Step 2: Expansions, Synonyms, & Transitions
+########################################
+# Map common full-token contractions to their expansions. Use exact-token
+# matching first to avoid splitting tokens like "can't" -> "ca not".
+# Whole-word contraction map (preferred replacements)
+WHOLE_CONTRACTIONS = {
+    "can't": "cannot",
+    "won't": "will not",
+    "shan't": "shall not",
+    "ain't": "is not",
+    "i'm": "i am",
+    "it's": "it is",
+    "we're": "we are",
+    "they're": "they are",
+    "you're": "you are",
+    "he's": "he is",
+    "she's": "she is",
+    "that's": "that is",
+    "there's": "there is",
+    "what's": "what is",
+    "who's": "who is",
+    "let's": "let us",
+    "didn't": "did not",
+    "doesn't": "does not",
+    "don't": "do not",
+    "couldn't": "could not",
+    "shouldn't": "should not",
+    "wouldn't": "would not",
+    "isn't": "is not",
+    "aren't": "are not",
+    "weren't": "were not",
+    "hasn't": "has not",
+    "haven't": "have not",
+    "hadn't": "had not",
+}
+
+# Suffix-based fallback contractions (used only if whole-word replacement didn't match)
+SUFFIX_CONTRACTIONS = {
+    "n't": " not",
+    "'re": " are",
+    "'s": " is",
+    "'ll": " will",
+    "'ve": " have",
+    "'d": " would",
+    "'m": " am"
+}
+
+ACADEMIC_TRANSITIONS = [
+    "Moreover,",
+    "Additionally,",
+    "Furthermore,",
+    "Hence,",
+    "Therefore,",
+    "Consequently,",
+    "Nonetheless,",
+    "Nevertheless,",
+    "In contrast,",
+    "On the other hand,",
+    "In addition,",
+    "As a result,",
+]
+
+def expand_contractions(sentence):
+    # 1) Apply whole-word contractions using regex on the raw sentence to
+    #    avoid tokenizers splitting contractions (e.g., "can't" -> "ca n't").
+    def _replace_whole(match):
+        orig = match.group(0)
+        key = orig.lower()
+        repl = WHOLE_CONTRACTIONS.get(key, orig)
+        # preserve capitalization of the first character
+        if orig and orig[0].isupper():
+            repl = repl.capitalize()
+        return repl
+
+    # Build a regex alternation for whole contractions and allow optional
+    # tokenized opening/closing quotes (`` and ''). This ensures we match
+    # contractions even when they appear as `` can't '' after tokenization.
+    alt = "|".join(re.escape(k) for k in WHOLE_CONTRACTIONS.keys())
+    whole_pattern = rf"(?:(``)\s*)?(?P<word>(?:{alt}))(?:\s*(''))?"
+
+    def _replace_whole_with_quotes(match):
+        open_tok = match.group(1) or ""
+        word = match.group('word')
+        close_tok = match.group(3) or ""
+        key = word.lower()
+        repl = WHOLE_CONTRACTIONS.get(key, word)
+        if word and word[0].isupper():
+            repl = repl.capitalize()
+        return f"{open_tok}{repl}{close_tok}"
+
+    sentence = re.sub(whole_pattern, _replace_whole_with_quotes,
+                      sentence, flags=re.IGNORECASE)
+
+    # 2) Tokenize and handle suffix-based contractions as a fallback
+    _, word_tokenize, _ = nltk_modules()
+    tokens = word_tokenize(sentence)
+    out_tokens = []
+    for t in tokens:
+        lower_t = t.lower()
+        replaced = False
+        for contr, expansion in SUFFIX_CONTRACTIONS.items():
+            if lower_t.endswith(contr):
+                base = lower_t[: -len(contr)]
+                new_t = base + expansion
+                if t and t[0].isupper():
+                    new_t = new_t.capitalize()
+                out_tokens.append(new_t)
+                replaced = True
+                break
+        if not replaced:
+            out_tokens.append(t)
+    return " ".join(out_tokens)
+
+def replace_synonyms(sentence, p_syn=0.2):
+    _, _, wordnet = nltk_modules()
+    doc = get_nlp()(sentence)
+    new_tokens = []
+    for token in doc:
+        if "[[REF_" in token.text:
+            new_tokens.append(token.text)
+            continue
+        if token.pos_ in ["ADJ", "NOUN", "VERB", "ADV"] and wordnet.synsets(token.text):
+            if random.random() < p_syn:
+                synonyms = get_synonyms(token.text, token.pos_)
+                if synonyms:
+                    new_tokens.append(random.choice(synonyms))
+                else:
+                    new_tokens.append(token.text)
+            else:
+                new_tokens.append(token.text)
+        else:
+            new_tokens.append(token.text)
+    return " ".join(new_tokens)
+
+
+def add_academic_transition(sentence, p_transition=0.2):
+    if random.random() < p_transition:
+        transition = random.choice(ACADEMIC_TRANSITIONS)
+        return f"{transition} {sentence}"
+    return sentence
+
+
+def get_synonyms(word, pos):
+    _, _, wordnet = nltk_modules()
+    wn_pos = None
+    if pos.startswith("ADJ"):
+        wn_pos = wordnet.ADJ
+    elif pos.startswith("NOUN"):
+        wn_pos = wordnet.NOUN
+    elif pos.startswith("ADV"):
+        wn_pos = wordnet.ADV
+    elif pos.startswith("VERB"):
+        wn_pos = wordnet.VERB
+
+    synonyms = set()
+    if wn_pos:
+        for syn in wordnet.synsets(word, pos=wn_pos):
+            for lemma in syn.lemmas():
+                lemma_name = lemma.name().replace("_", " ")
+                if lemma_name.lower() != word.lower():
+                    synonyms.add(lemma_name)
+    return list(synonyms)
+
+
+########################################
+# Step 3: Minimal "Humanize" line-by-line
+########################################
+def minimal_humanize_line(line, p_syn=0.2, p_trans=0.2):
+    line = expand_contractions(line)
+    line = replace_synonyms(line, p_syn=p_syn)
+    line = add_academic_transition(line, p_transition=p_trans)
+    return line
+
+
+def minimal_rewriting(text, p_syn=0.2, p_trans=0.2):
+    sent_tokenize, _, _ = nltk_modules()
+    lines = sent_tokenize(text)
+    out_lines = [
+        minimal_humanize_line(ln, p_syn=p_syn, p_trans=p_trans) for ln in lines
+    ]
+    return " ".join(out_lines)
+
+
+def preserve_linebreaks_rewrite(text, p_syn=0.2, p_trans=0.2):
+    """Rewrite text while preserving original line breaks.
+
+    Splits the input on newline characters and rewrites each non-empty line
+    independently, keeping blank lines and original line structure.
+    """
+    lines = text.splitlines()
+    out_lines = []
+    for ln in lines:
+        if not ln.strip():
+            out_lines.append("")
+        else:
+            out_lines.append(minimal_rewriting(
+                ln, p_syn=p_syn, p_trans=p_trans))
+    # Rejoin using single newline to preserve original paragraph/line breaks
+    return "\n".join(out_lines)
+
+
+########################################
+# Full pipeline
+########################################
+def tidy_output(text):
+    # Normalize spaces around punctuation but do not remove newlines
+    text = re.sub(r"[ \t]+([.,;:!?])", r"\1", text)
+    text = re.sub(r"(\()[ \t]+", r"\1", text)
+    text = re.sub(r"[ \t]+(\))", r"\1", text)
+    # Collapse multiple spaces/tabs (but keep newlines)
+    text = re.sub(r"[ \t]{2,}", " ", text)
+    # Normalize paired tokenized quotes: `` ... '' -> "..." (remove stray spaces)
+    text = re.sub(r"``\s*(.+?)\s*''", r'"\1"', text)
+    return text
+
+
+def humanize(text, p_syn=0.2, p_trans=0.2, preserve_linebreaks=True):
+    """Protect citations, rewrite, restore citations and tidy spacing."""
+    no_refs_text, placeholders = extract_citations(text)
+    if preserve_linebreaks:
+        rewritten = preserve_linebreaks_rewrite(no_refs_text, p_syn=p_syn, p_trans=p_trans)
+    else:
+        rewritten = minimal_rewriting(no_refs_text, p_syn=p_syn, p_trans=p_trans)
+    return tidy_output(restore_citations(rewritten, placeholders))
@@ -1,300 +1,14 @@
-import random
-import re
-import ssl
-import warnings
-import nltk
-import spacy
 import streamlit as st
-from nltk.corpus import wordnet
-from nltk.tokenize import sent_tokenize, word_tokenize
 
-warnings.filterwarnings("ignore", category=FutureWarning)
-
-########################################
-# Download needed NLTK resources
-########################################
-def download_nltk_resources():
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = _create_unverified_https_context
-
-    resources = [
-        ('tokenizers/punkt', 'punkt'),
-        ('taggers/averaged_perceptron_tagger', 'averaged_perceptron_tagger'),
-        ('tokenizers/punkt_tab', 'punkt_tab'),
-        ('corpora/wordnet', 'wordnet'),
-        ('taggers/averaged_perceptron_tagger_eng', 'averaged_perceptron_tagger_eng')
-    ]
-
-    for path, name in resources:
-        try:
-            nltk.data.find(path)
-        except LookupError:
-            try:
-                nltk.download(name, quiet=True)
-            except Exception as e:
-                # Print to stderr so we don't corrupt stdout for CLI usage
-                import sys
-                print(f"[Warning] Failed to download {name}: {e}", file=sys.stderr)
-
-download_nltk_resources()
-
-########################################
-# Prepare spaCy pipeline
-########################################
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    st.warning("spaCy en_core_web_sm model not found. Install with: python -m spacy download en_core_web_sm")
-    nlp = None
-
-########################################
-# Citation Regex
-########################################
-CITATION_REGEX = re.compile(
-    r"\(\s*[A-Za-z&\-,\.\s]+(?:et al\.\s*)?,\s*\d{4}(?:,\s*(?:pp?\.\s*\d+(?:-\d+)?))?\s*\)"
+from humanize_core import (
+    count_sentences,
+    count_words,
+    extract_citations,
+    preserve_linebreaks_rewrite,
+    restore_citations,
+    tidy_output,
 )
 
-########################################
-# Helper: Word & Sentence Counts
-########################################
-def count_words(text):
-    return len(word_tokenize(text))
-
-def count_sentences(text):
-    return len(sent_tokenize(text))
-
-########################################
-# Step 1: Extract & Restore Citations
-########################################
-def extract_citations(text):
-    refs = CITATION_REGEX.findall(text)
-    placeholder_map = {}
-    replaced_text = text
-    for i, r in enumerate(refs, start=1):
-        placeholder = f"[[REF_{i}]]"
-        placeholder_map[placeholder] = r
-        replaced_text = replaced_text.replace(r, placeholder, 1)
-    return replaced_text, placeholder_map
-
-PLACEHOLDER_REGEX = re.compile(r"\[\s*\[\s*REF_(\d+)\s*\]\s*\]")
-
-
-def restore_citations(text, placeholder_map):
-
-    def replace_placeholder(match):
-        # match.group(1) contains the numeric index captured from the placeholder
-        idx = match.group(1)
-        key = f"[[REF_{idx}]]"
-        return placeholder_map.get(key, match.group(0))
-
-    restored = PLACEHOLDER_REGEX.sub(replace_placeholder, text)
-    return restored
-
-
-########################################
-# Step 2: Expansions, Synonyms, & Transitions
-########################################
-# Map common full-token contractions to their expansions. Use exact-token
-# matching first to avoid splitting tokens like "can't" -> "ca not".
-# Whole-word contraction map (preferred replacements)
-WHOLE_CONTRACTIONS = {
-    "can't": "cannot",
-    "won't": "will not",
-    "shan't": "shall not",
-    "ain't": "is not",
-    "i'm": "i am",
-    "it's": "it is",
-    "we're": "we are",
-    "they're": "they are",
-    "you're": "you are",
-    "he's": "he is",
-    "she's": "she is",
-    "that's": "that is",
-    "there's": "there is",
-    "what's": "what is",
-    "who's": "who is",
-    "let's": "let us",
-    "didn't": "did not",
-    "doesn't": "does not",
-    "don't": "do not",
-    "couldn't": "could not",
-    "shouldn't": "should not",
-    "wouldn't": "would not",
-    "isn't": "is not",
-    "aren't": "are not",
-    "weren't": "were not",
-    "hasn't": "has not",
-    "haven't": "have not",
-    "hadn't": "had not",
-}
-
-# Suffix-based fallback contractions (used only if whole-word replacement didn't match)
-SUFFIX_CONTRACTIONS = {
-    "n't": " not",
-    "'re": " are",
-    "'s": " is",
-    "'ll": " will",
-    "'ve": " have",
-    "'d": " would",
-    "'m": " am"
-}
-
-ACADEMIC_TRANSITIONS = [
-    "Moreover,",
-    "Additionally,",
-    "Furthermore,",
-    "Hence,",
-    "Therefore,",
-    "Consequently,",
-    "Nonetheless,",
-    "Nevertheless,",
-    "In contrast,",
-    "On the other hand,",
-    "In addition,",
-    "As a result,",
-]
-
-def expand_contractions(sentence):
-    # 1) Apply whole-word contractions using regex on the raw sentence to
-    #    avoid tokenizers splitting contractions (e.g., "can't" -> "ca n't").
-    def _replace_whole(match):
-        orig = match.group(0)
-        key = orig.lower()
-        repl = WHOLE_CONTRACTIONS.get(key, orig)
-        # preserve capitalization of the first character
-        if orig and orig[0].isupper():
-            repl = repl.capitalize()
-        return repl
-
-    # Build a regex alternation for whole contractions and allow optional
-    # tokenized opening/closing quotes (`` and ''). This ensures we match
-    # contractions even when they appear as `` can't '' after tokenization.
-    alt = "|".join(re.escape(k) for k in WHOLE_CONTRACTIONS.keys())
-    whole_pattern = rf"(?:(``)\s*)?(?P<word>(?:{alt}))(?:\s*(''))?"
-
-    def _replace_whole_with_quotes(match):
-        open_tok = match.group(1) or ""
-        word = match.group('word')
-        close_tok = match.group(3) or ""
-        key = word.lower()
-        repl = WHOLE_CONTRACTIONS.get(key, word)
-        if word and word[0].isupper():
-            repl = repl.capitalize()
-        return f"{open_tok}{repl}{close_tok}"
-
-    sentence = re.sub(whole_pattern, _replace_whole_with_quotes,
-                      sentence, flags=re.IGNORECASE)
-
-    # 2) Tokenize and handle suffix-based contractions as a fallback
-    tokens = word_tokenize(sentence)
-    out_tokens = []
-    for t in tokens:
-        lower_t = t.lower()
-        replaced = False
-        for contr, expansion in SUFFIX_CONTRACTIONS.items():
-            if lower_t.endswith(contr):
-                base = lower_t[: -len(contr)]
-                new_t = base + expansion
-                if t and t[0].isupper():
-                    new_t = new_t.capitalize()
-                out_tokens.append(new_t)
-                replaced = True
-                break
-        if not replaced:
-            out_tokens.append(t)
-    return " ".join(out_tokens)
-
-def replace_synonyms(sentence, p_syn=0.2):
-    if not nlp:
-        return sentence
-
-    doc = nlp(sentence)
-    new_tokens = []
-    for token in doc:
-        if "[[REF_" in token.text:
-            new_tokens.append(token.text)
-            continue
-        if token.pos_ in ["ADJ", "NOUN", "VERB", "ADV"] and wordnet.synsets(token.text):
-            if random.random() < p_syn:
-                synonyms = get_synonyms(token.text, token.pos_)
-                if synonyms:
-                    new_tokens.append(random.choice(synonyms))
-                else:
-                    new_tokens.append(token.text)
-            else:
-                new_tokens.append(token.text)
-        else:
-            new_tokens.append(token.text)
-    return " ".join(new_tokens)
-
-
-def add_academic_transition(sentence, p_transition=0.2):
-    if random.random() < p_transition:
-        transition = random.choice(ACADEMIC_TRANSITIONS)
-        return f"{transition} {sentence}"
-    return sentence
-
-
-def get_synonyms(word, pos):
-    wn_pos = None
-    if pos.startswith("ADJ"):
-        wn_pos = wordnet.ADJ
-    elif pos.startswith("NOUN"):
-        wn_pos = wordnet.NOUN
-    elif pos.startswith("ADV"):
-        wn_pos = wordnet.ADV
-    elif pos.startswith("VERB"):
-        wn_pos = wordnet.VERB
-
-    synonyms = set()
-    if wn_pos:
-        for syn in wordnet.synsets(word, pos=wn_pos):
-            for lemma in syn.lemmas():
-                lemma_name = lemma.name().replace("_", " ")
-                if lemma_name.lower() != word.lower():
-                    synonyms.add(lemma_name)
-    return list(synonyms)
-
-
-########################################
-# Step 3: Minimal "Humanize" line-by-line
-########################################
-def minimal_humanize_line(line, p_syn=0.2, p_trans=0.2):
-    line = expand_contractions(line)
-    line = replace_synonyms(line, p_syn=p_syn)
-    line = add_academic_transition(line, p_transition=p_trans)
-    return line
-
-
-def minimal_rewriting(text, p_syn=0.2, p_trans=0.2):
-    lines = sent_tokenize(text)
-    out_lines = [
-        minimal_humanize_line(ln, p_syn=p_syn, p_trans=p_trans) for ln in lines
-    ]
-    return " ".join(out_lines)
-
-
-def preserve_linebreaks_rewrite(text, p_syn=0.2, p_trans=0.2):
-    """Rewrite text while preserving original line breaks.
-
-    Splits the input on newline characters and rewrites each non-empty line
-    independently, keeping blank lines and original line structure.
-    """
-    lines = text.splitlines()
-    out_lines = []
-    for ln in lines:
-        if not ln.strip():
-            out_lines.append("")
-        else:
-            out_lines.append(minimal_rewriting(
-                ln, p_syn=p_syn, p_trans=p_trans))
-    # Rejoin using single newline to preserve original paragraph/line breaks
-    return "\n".join(out_lines)
-
 
 ########################################
 # Final: Show Humanize Page
@@ -420,17 +134,8 @@ def show_humanize_page():
             )
             
         with st.spinner("✅ Restoring citations and finalizing..."):
-            # Restore citations
-            final_text = restore_citations(partially_rewritten, placeholders)
-
-            # Normalize spaces around punctuation but do not remove newlines
-            final_text = re.sub(r"[ \t]+([.,;:!?])", r"\1", final_text)
-            final_text = re.sub(r"(\()[ \t]+", r"\1", final_text)
-            final_text = re.sub(r"[ \t]+(\))", r"\1", final_text)
-            # Collapse multiple spaces/tabs (but keep newlines)
-            final_text = re.sub(r"[ \t]{2,}", " ", final_text)
-            # Normalize paired tokenized quotes: `` ... '' -> "..." (remove stray spaces)
-            final_text = re.sub(r"``\s*(.+?)\s*''", r'"\1"', final_text)
+            # Restore citations and normalize spacing
+            final_text = tidy_output(restore_citations(partially_rewritten, placeholders))
 
         # Calculate new stats
         new_wc = count_words(final_text)
@@ -25,6 +25,7 @@ export PATH=$HOME/.local/bin:$PATH
 python3 - <<EOF
 import nltk
 nltk.download('punkt', quiet=True)
+nltk.download('punkt_tab', quiet=True)
 nltk.download('wordnet', quiet=True)
 
 import spacy
@@ -58,7 +58,7 @@ export async function POST(request: NextRequest) {
         })
 
         // Analyze the text using local detector
-        const analysisResult = await detectAI(content)
+        const analysisResult = await detectAI(content, session.userId)
 
         // Save analysis result message
         const analysisMessage = await prisma.message.create({
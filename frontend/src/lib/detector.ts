@@ -28,7 +28,66 @@ async function getDetectorSettings() {
     }
 }
 
-export async function detectAI(text: string): Promise<AnalysisResult> {
+// Segments scoring above this count as AI-written (AI_THRESHOLD in model/registry.py)
+const AI_THRESHOLD = 0.5
+
+// The rephrase service stops starting new work after its time budget; keep
+// that well below the client timeout so it has finished by the time we give
+// up and fall back to humanize_cli.py.
+const REPHRASE_TIMEOUT_MS = 30000
+const REPHRASE_BUDGET_MS = 15000
+
+export interface DetectedLine {
+    text: string
+    start: number
+    end: number
+    confidence: number
+}
+
+export interface VerifiedRephrase {
+    humanizedText: string
+    iterations: number
+    // Every segment of humanizedText with its AI probability
+    lines: DetectedLine[]
+}
+
+// Humanize on the model service, which re-checks the result and only reworks
+// sentences that are still flagged. Returns null if the service can't do it.
+export async function rephraseAndVerify(text: string, pSyn: number, pTrans: number): Promise<VerifiedRephrase | null> {
+    const { detectionApiUrl } = await getDetectorSettings()
+    const rephraseApiUrl = detectionApiUrl.replace(/\/detect\/?$/, '/rephrase')
+
+    if (rephraseApiUrl === detectionApiUrl) return null
+
+    try {
+        const res = await fetch(rephraseApiUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ text, p_syn: pSyn, p_trans: pTrans, time_budget_ms: REPHRASE_BUDGET_MS }),
+            signal: AbortSignal.timeout(REPHRASE_TIMEOUT_MS)
+        })
+
+        if (!res.ok) return null
+
+        const data = await res.json()
+        if (typeof data.humanized_text !== 'string') return null
+
+        return {
+            humanizedText: data.humanized_text,
+            iterations: data.stats?.iterations ?? 1,
+            lines: Array.isArray(data.lines) ? data.lines : []
+        }
+    } catch (err) {
+        console.warn("Rephrase service failed:", err)
+        return null
+    }
+}
+
+// `owner` (the user id) keeps a user's own earlier submissions from
+// counting as plagiarism sources for their later ones. `scoredLines` are
+// per-segment scores already computed for this exact text (e.g. by
+// rephraseAndVerify); when given, the detection service isn't called again.
+export async function detectAI(text: string, owner?: string, scoredLines?: DetectedLine[]): Promise<AnalysisResult> {
     const { detectionApiUrl, plagiarismApiUrl } = await getDetectorSettings()
 
     const result: AnalysisResult = {
@@ -43,19 +102,27 @@ export async function detectAI(text: string): Promise<AnalysisResult> {
     // AI DETECTION
     // =========================
     try {
-        const res = await fetch(detectionApiUrl, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text })
-        })
-
-        if (res.ok) {
-            const data = await res.json()
-
-            // New API format returns { lines: [{ text, start, end, confidence }] }
-            // containing ONLY AI-detected lines.
-            const aiLines = data.lines || []
+        let aiLines: DetectedLine[] | null = null
+
+        if (scoredLines) {
+            aiLines = scoredLines.filter(line => line.confidence > AI_THRESHOLD)
+        } else {
+            const res = await fetch(detectionApiUrl, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ text })
+            })
+
+            if (res.ok) {
+                const data = await res.json()
+
+                // New API format returns { lines: [{ text, start, end, confidence }] }
+                // containing ONLY AI-detected lines.
+                aiLines = data.lines || []
+            }
+        }
 
+        if (aiLines) {
             let totalAiLength = 0
 
             if (aiLines.length > 0) {
@@ -100,7 +167,7 @@ export async function detectAI(text: string): Promise<AnalysisResult> {
         const plagRes = await fetch(plagiarismApiUrl, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text }),
+            body: JSON.stringify({ text, owner }),
             // Python server might take time to process parallel requests
             signal: AbortSignal.timeout(300000) // 5min timeout
         })
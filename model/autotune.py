@@ -0,0 +1,327 @@
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import socket
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+import torch
+
+from registry import DEFAULT_MODEL, WARMUP_TEXTS
+
+# Sweep batch size and torch thread layout on this machine and save the
+# best configuration for run.py to pick up on start:
+#   python autotune.py                  # full sweep
+#   python autotune.py --quick --max-p95-ms 300
+#   python autotune.py --workers 4      # only the layout for 4 server processes
+# Results are stored per host in AUTOTUNE_DIR/<host>.json. Containers get a
+# new hostname on every start, so set AUTOTUNE_HOST to the node type there.
+
+AUTOTUNE_DIR = os.environ.get("AUTOTUNE_DIR", str(Path(__file__).parent / "autotune"))
+AUTOTUNE_HOST = os.environ.get("AUTOTUNE_HOST") or socket.gethostname()
+
+BATCH_SIZES = [1, 4, 8, 16, 32, 64]
+INTEROP_THREADS = [1, 2]
+
+# Segment lengths in words follow a log-normal distribution; these match
+# sentences in typical essay and chat submissions (median ~18 words with a
+# long tail of run-on paragraphs).
+SEGMENT_WORDS_MEDIAN = 18
+SEGMENT_WORDS_SIGMA = 0.6
+SEGMENT_WORDS_MAX = 200
+
+# Segments per simulated /detect request when measuring latency
+DOC_SEGMENTS = 24
+
+VOCABULARY = sorted({w.strip(".,").lower() for text in WARMUP_TEXTS for w in text.split()})
+
+
+# =========================
+# Workload
+# =========================
+def synthetic_segments(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    segments = []
+    for _ in range(n):
+        words = rng.lognormvariate(math.log(SEGMENT_WORDS_MEDIAN), SEGMENT_WORDS_SIGMA)
+        words = max(3, min(SEGMENT_WORDS_MAX, int(words)))
+        text = " ".join(rng.choice(VOCABULARY) for _ in range(words))
+        segments.append(text.capitalize() + ".")
+    return segments
+
+
+def layouts(cpus: int, workers: Optional[int] = None) -> List[tuple]:
+    """
+    (workers, intra-op threads) pairs that fill the machine without
+    oversubscribing it: one worker using every core, down to one per core.
+    With a fixed number of workers, only that layout.
+    """
+    if workers:
+        return [(workers, max(1, cpus // workers))]
+    threads = sorted({t for t in (1, 2, 4, 8, 16, 32, 64) if t <= cpus} | {cpus})
+    return [(max(1, cpus // t), t) for t in reversed(threads)]
+
+
+# =========================
+# Measurement (worker processes)
+# =========================
+def _measure(model: str, revision: Optional[str], intra: int, interop: int,
+             batch_sizes: List[int], segments: int, doc_segments: int, seed: int, barrier) -> List[dict]:
+    torch.set_num_threads(intra)
+    torch.set_num_interop_threads(interop)
+
+    from registry import ModelHandle
+    handle = ModelHandle(model, revision, -1)
+    handle.warm()
+
+    texts = synthetic_segments(segments, seed)
+    docs = [texts[i:i + doc_segments] for i in range(0, len(texts), doc_segments)]
+
+    results = []
+    for batch_size in batch_sizes:
+        handle.classify(docs[0], batch_size=batch_size)
+        # Workers start each measurement together so they compete for cores
+        # the way concurrent requests would
+        barrier.wait()
+        latencies = []
+        started = time.perf_counter()
+        for doc in docs:
+            t = time.perf_counter()
+            handle.classify(doc, batch_size=batch_size)
+            latencies.append((time.perf_counter() - t) * 1000)
+        elapsed = time.perf_counter() - started
+        results.append({"batch_size": batch_size, "elapsed": elapsed, "latencies": latencies})
+    return results
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def sweep(model: str, revision: Optional[str], batch_sizes: List[int], interop_threads: List[int],
+          segments: int, doc_segments: int, cpus: int, workers: Optional[int] = None) -> List[dict]:
+    """
+    Measure every layout x inter-op x batch size. Each layout runs in fresh
+    processes, since torch fixes its thread pools on first use.
+    """
+    ctx = mp.get_context("spawn")
+    results = []
+
+    for workers, intra in layouts(cpus, workers):
+        for interop in interop_threads:
+            print(f"workers={workers} intra_op={intra} inter_op={interop}", file=sys.stderr)
+            with ctx.Manager() as manager, ctx.Pool(workers) as pool:
+                barrier = manager.Barrier(workers)
+                per_worker = pool.starmap(_measure, [
+                    (model, revision, intra, interop, batch_sizes, segments, doc_segments, seed, barrier)
+                    for seed in range(workers)
+                ])
+
+            for b, batch_size in enumerate(batch_sizes):
+                runs = [w[b] for w in per_worker]
+                latencies = [ms for r in runs for ms in r["latencies"]]
+                row = {
+                    "workers": workers,
+                    "intra_op_threads": intra,
+                    "inter_op_threads": interop,
+                    "batch_size": batch_size,
+                    "segments_per_s": round(sum(segments / r["elapsed"] for r in runs), 2),
+                    "p50_ms": round(_percentile(latencies, 0.5), 2),
+                    "p95_ms": round(_percentile(latencies, 0.95), 2),
+                }
+                print(f"  batch_size={batch_size}: {row['segments_per_s']} segments/s, "
+                      f"p95 {row['p95_ms']} ms", file=sys.stderr)
+                results.append(row)
+
+    return results
+
+
+# =========================
+# Selection
+# =========================
+def pareto_frontier(results: List[dict]) -> List[dict]:
+    """
+    Configurations no other one beats on both throughput and p95 latency.
+    """
+    frontier = [
+        r for r in results
+        if not any(
+            o["segments_per_s"] >= r["segments_per_s"] and o["p95_ms"] <= r["p95_ms"]
+            and (o["segments_per_s"] > r["segments_per_s"] or o["p95_ms"] < r["p95_ms"])
+            for o in results
+        )
+    ]
+    return sorted(frontier, key=lambda r: r["p95_ms"])
+
+
+def choose(results: List[dict], max_p95_ms: Optional[float], workers: Optional[int] = None) -> Optional[dict]:
+    """
+    Highest throughput within the latency limit, or the fastest
+    configuration if none meets it. With `workers`, only layouts with that
+    many processes are considered, since a server cannot change its own
+    process count; None if none was measured.
+    """
+    frontier = pareto_frontier([r for r in results if workers is None or r["workers"] == workers])
+    if not frontier:
+        return None
+    allowed = [r for r in frontier if max_p95_ms is None or r["p95_ms"] <= max_p95_ms]
+    if not allowed:
+        return min(frontier, key=lambda r: r["p95_ms"])
+    return max(allowed, key=lambda r: r["segments_per_s"])
+
+
+# =========================
+# Persistence
+# =========================
+def config_path(directory: str = AUTOTUNE_DIR) -> Path:
+    return Path(directory) / f"{AUTOTUNE_HOST}.json"
+
+
+def load_config(path: Optional[str] = None) -> Optional[dict]:
+    p = Path(path) if path else config_path()
+    if not p.exists():
+        return None
+    return json.loads(p.read_text())
+
+
+def save_config(config: dict, path: Optional[str] = None) -> Path:
+    p = Path(path) if path else config_path()
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".tmp")
+    tmp.write_text(json.dumps(config, indent=2))
+    os.replace(tmp, p)
+    return p
+
+
+def settings_for(config: dict, workers: int) -> dict:
+    """
+    The best measured configuration for a server running `workers`
+    processes. If that layout was not swept, keep the chosen batch size and
+    split the cores evenly between the processes.
+    """
+    chosen = choose(config["results"], config["max_p95_ms"], workers)
+    if chosen is None:
+        chosen = dict(config["chosen"], workers=workers, intra_op_threads=max(1, config["cpus"] // workers))
+    return chosen
+
+
+def apply_config(config: dict, workers: int = 1) -> dict:
+    """
+    Set torch thread pools from a saved configuration for a server running
+    `workers` processes, returning the settings used. Must run before the
+    model is loaded.
+    """
+    chosen = settings_for(config, workers)
+    torch.set_num_threads(chosen["intra_op_threads"])
+    try:
+        torch.set_num_interop_threads(chosen["inter_op_threads"])
+    except RuntimeError:
+        pass  # inter-op pool already started, keep torch's default
+    return chosen
+
+
+def autotune(model: str, revision: Optional[str], quick: bool = False,
+             max_p95_ms: Optional[float] = None, cpus: Optional[int] = None,
+             workers: Optional[int] = None) -> dict:
+    cpus = cpus or os.cpu_count() or 1
+    started = time.perf_counter()
+    results = sweep(
+        model, revision,
+        batch_sizes=[1, 8, 32] if quick else BATCH_SIZES,
+        interop_threads=[1] if quick else INTEROP_THREADS,
+        segments=96 if quick else 256,
+        doc_segments=DOC_SEGMENTS,
+        cpus=cpus,
+        workers=workers,
+    )
+    frontier = pareto_frontier(results)
+
+    return {
+        "host": AUTOTUNE_HOST,
+        "cpus": cpus,
+        "torch": torch.__version__,
+        "model": model,
+        "revision": revision,
+        "created_at": time.time(),
+        "duration_s": round(time.perf_counter() - started, 1),
+        "max_p95_ms": max_p95_ms,
+        "chosen": choose(results, max_p95_ms),
+        "frontier": frontier,
+        "results": results,
+    }
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """
+    Exclusive lock on `path`, blocking until it is free. The locking
+    modules are platform specific, so they are only imported here.
+    """
+    with open(path, "a") as f:
+        if sys.platform == "win32":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # Retries for about 10 s before raising; a sweep takes longer
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_or_autotune(model: str, revision: Optional[str], workers: int, path: Optional[str] = None) -> dict:
+    """
+    Load this host's configuration, running a quick sweep for `workers`
+    processes first if there is none. Server processes starting together
+    take a file lock, so one of them sweeps and the rest load its result.
+    """
+    p = Path(path) if path else config_path()
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with _file_lock(p.with_suffix(".lock")):
+        config = load_config(str(p))
+        if config is None:
+            config = autotune(model, revision, quick=True, workers=workers)
+            save_config(config, str(p))
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune batch size and thread layout for this host")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", DEFAULT_MODEL))
+    parser.add_argument("--revision", default=os.environ.get("MODEL_REVISION") or None)
+    parser.add_argument("--quick", action="store_true", help="Fewer batch sizes and segments")
+    parser.add_argument("--max-p95-ms", type=float, help=f"p95 latency limit for a {DOC_SEGMENTS}-segment request")
+    parser.add_argument("--cpus", type=int, help="Cores to plan for (default: all)")
+    parser.add_argument("--workers", type=int, help="Only sweep the layout for this many server processes")
+    parser.add_argument("--output", help="Defaults to AUTOTUNE_DIR/<host>.json")
+    args = parser.parse_args()
+
+    config = autotune(args.model, args.revision, args.quick, args.max_p95_ms, args.cpus, args.workers)
+    path = save_config(config, args.output)
+
+    chosen = config["chosen"]
+    print(json.dumps({"config": str(path), "chosen": chosen, "frontier": config["frontier"]}, indent=2))
+    if chosen["workers"] > 1:
+        # uvicorn reads WEB_CONCURRENCY too, so run.py sees the same count
+        print(f"Run {chosen['workers']} server processes to use the whole machine, e.g. "
+              f"WEB_CONCURRENCY={chosen['workers']} uvicorn run:app", file=sys.stderr)
@@ -0,0 +1,252 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+from registry import AI_THRESHOLD, DEFAULT_MODEL, ModelHandle
+from utils import clean_text, iter_documents, split_lines_with_offsets
+
+# Re-score a corpus offline, without going through /detect:
+#   python bulk.py submissions/ archive.jsonl --output scores.jsonl
+# Interrupted runs pick up from the checkpoint next to the output.
+
+
+# =========================
+# Segmentation (worker processes)
+# =========================
+def segment_document(text: str):
+    """
+    Split and clean one document exactly like /detect does.
+    """
+    text = text.strip()
+    lines = list(split_lines_with_offsets(text))
+    return len(text), lines, [clean_text(l[0]) for l in lines]
+
+
+# =========================
+# Output
+# =========================
+class JsonlWriter:
+    """
+    Appends rows to one JSONL file.
+
+    Anything past `offset` is left over from an interrupted chunk and is
+    cut off. A fresh run refuses to overwrite a non-empty file unless
+    `restart` allows discarding it.
+    """
+
+    def __init__(self, path: Path, offset: int, restart: bool = False):
+        if offset == 0 and not restart and path.exists() and path.stat().st_size > 0:
+            sys.exit(f"{path} already has results; pass --restart to replace them")
+        self.path = path
+        self.file = open(path, "r+b" if path.exists() else "wb")
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, rows: List[dict]) -> dict:
+        for row in rows:
+            self.file.write((json.dumps(row) + "\n").encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"offset": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    Writes one part file per chunk into a dataset directory.
+
+    Parts numbered from `part` up are left over from an interrupted chunk
+    and are removed. A fresh run refuses to mix into an existing dataset
+    unless `restart` allows discarding it.
+    """
+
+    def __init__(self, path: Path, part: int, restart: bool = False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow: pip install pyarrow")
+
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.part = part
+        self.schema = pa.schema([
+            ("id", pa.string()),
+            ("segments", pa.int64()),
+            ("ai_segments", pa.int64()),
+            ("ai_percentage", pa.float64()),
+            ("lines", pa.list_(pa.struct([
+                ("text", pa.string()),
+                ("start", pa.int64()),
+                ("end", pa.int64()),
+                ("confidence", pa.float64()),
+            ]))),
+        ])
+        path.mkdir(parents=True, exist_ok=True)
+
+        stale = [p for p in path.glob("part-*.parquet") if int(p.stem.split("-")[1]) >= part]
+        if stale and part == 0 and not restart:
+            sys.exit(f"{path} already has {len(stale)} part files; pass --restart to replace them")
+        for p in stale:
+            p.unlink()
+
+    def write(self, rows: List[dict]) -> dict:
+        table = self.pa.Table.from_pylist(rows, schema=self.schema)
+        self.pq.write_table(table, self.path / f"part-{self.part:05d}.parquet")
+        self.part += 1
+        return {"part": self.part}
+
+    def close(self):
+        pass
+
+
+# =========================
+# Checkpoint
+# =========================
+def load_checkpoint(path: Path, inputs: List[str], restart: bool) -> dict:
+    fresh = {"inputs": inputs, "done": 0, "segments": 0, "elapsed": 0.0, "offset": 0, "part": 0}
+    if restart or not path.exists():
+        return fresh
+
+    state = json.loads(path.read_text())
+    if state["inputs"] != inputs:
+        sys.exit(f"{path} belongs to a run over {state['inputs']}; pass --restart to discard it")
+    return state
+
+
+def save_checkpoint(path: Path, state: dict):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+def build_row(doc_id: str, length: int, lines, probs) -> dict:
+    ai_lines = [
+        {"text": line, "start": start, "end": end, "confidence": round(prob, 4)}
+        for (line, start, end), prob in zip(lines, probs)
+        if prob > AI_THRESHOLD
+    ]
+    ai_chars = sum(l["end"] - l["start"] for l in ai_lines)
+    return {
+        "id": doc_id,
+        "segments": len(lines),
+        "ai_segments": len(ai_lines),
+        "ai_percentage": round(min(100.0, ai_chars / length * 100), 2) if length else 0.0,
+        "lines": ai_lines,
+    }
+
+
+def run(args):
+    output = Path(args.output)
+    fmt = args.format or ("parquet" if output.suffix == ".parquet" else "jsonl")
+    checkpoint_path = Path(args.checkpoint or f"{output}.checkpoint.json")
+    inputs = [str(Path(p).resolve()) for p in args.inputs]
+
+    state = load_checkpoint(checkpoint_path, inputs, args.restart)
+    if state["done"]:
+        print(f"Resuming after {state['done']} documents", file=sys.stderr)
+
+    docs = itertools.chain.from_iterable(iter_documents(Path(p)) for p in inputs)
+    docs = itertools.islice(docs, state["done"], None)
+
+    timings = {"segmentation_wait": 0.0, "model": 0.0, "write": 0.0}
+    run_docs = run_segments = 0
+    previous_elapsed = state["elapsed"]
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        def submit():
+            chunk = list(itertools.islice(docs, args.chunk_docs))
+            if not chunk:
+                return None
+            chunksize = max(1, len(chunk) // (args.workers * 4))
+            return chunk, pool.map(segment_document, [text for _, text in chunk], chunksize=chunksize)
+
+        # The first submit forks the workers, before the model is loaded so
+        # they don't inherit its memory and threads
+        pending = submit()
+
+        handle = ModelHandle(args.model, args.revision, args.device)
+        if fmt == "parquet":
+            writer = ParquetWriter(output, state["part"], args.restart)
+        else:
+            writer = JsonlWriter(output, state["offset"], args.restart)
+
+        # Segment the next chunk in the pool while the model scores this one
+        while pending is not None:
+            chunk, results = pending
+            pending = submit()
+
+            t = time.perf_counter()
+            segmented = list(results)
+            timings["segmentation_wait"] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            flat = [c for _, _, cleaned in segmented for c in cleaned]
+            # The direct backend sorts by token length itself
+            probs = handle.classify(flat, batch_size=args.batch_size)
+            timings["model"] += time.perf_counter() - t
+
+            rows = []
+            pos = 0
+            for (doc_id, _), (length, lines, cleaned) in zip(chunk, segmented):
+                rows.append(build_row(doc_id, length, lines, probs[pos:pos + len(cleaned)]))
+                pos += len(cleaned)
+
+            t = time.perf_counter()
+            state.update(writer.write(rows))
+            run_docs += len(chunk)
+            run_segments += len(flat)
+            state["done"] += len(chunk)
+            state["segments"] += len(flat)
+            state["elapsed"] = previous_elapsed + time.perf_counter() - started
+            save_checkpoint(checkpoint_path, state)
+            timings["write"] += time.perf_counter() - t
+
+            elapsed = time.perf_counter() - started
+            print(f"{state['done']} documents, {state['segments']} segments "
+                  f"({run_segments / elapsed:.1f} segments/s)", file=sys.stderr)
+
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "output": str(output),
+        "format": fmt,
+        "documents": run_docs,
+        "segments": run_segments,
+        "elapsed_s": round(elapsed, 2),
+        "documents_per_s": round(run_docs / elapsed, 2) if elapsed else None,
+        "segments_per_s": round(run_segments / elapsed, 2) if elapsed else None,
+        "timings_s": {k: round(v, 2) for k, v in timings.items()},
+        "total_documents": state["done"],
+        "total_segments": state["segments"],
+        "total_elapsed_s": round(state["elapsed"], 2),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline bulk AI detection over a corpus")
+    parser.add_argument("inputs", nargs="+", help="Directories of .txt/.md files, JSONL or CSV files")
+    parser.add_argument("--output", required=True, help="Results .jsonl file or .parquet dataset directory")
+    parser.add_argument("--format", choices=["jsonl", "parquet"])
+    parser.add_argument("--checkpoint", help="Defaults to <output>.checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for segmentation and cleaning")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--chunk-docs", type=int, default=256, help="Documents per checkpoint")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", DEFAULT_MODEL))
+    parser.add_argument("--revision", default=os.environ.get("MODEL_REVISION") or None)
+    parser.add_argument("--device", type=int, default=-1)
+
+    run(parser.parse_args())
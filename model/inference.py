@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+# Compare the direct path with the transformers pipeline on real or
+# synthetic segments:
+#   python inference.py submissions/ --limit 2000
+#   python inference.py --synthetic 1000
+
+# Batch size when neither the caller nor the autotuner sets one
+DEFAULT_BATCH_SIZE = 32
+
+
+def _untimed(name: str, **info):
+    return nullcontext(info)
+
+
+class DirectClassifier:
+    """
+    Runs the fast tokenizer and the model directly, without the pipeline's
+    per-item preprocess/forward/postprocess loop.
+
+    The whole list is encoded in one call, split into batches of similar
+    length to keep padding low, and the AI column of the softmax is
+    gathered for every batch at once.
+
+    Given a profiling.StageTimer, tokenization and every batch's padding,
+    forward pass and post-processing are recorded as stages, with real and
+    padding token counts on the "pad" stages.
+    """
+
+    def __init__(self, tokenizer, model, ai_index: int):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.ai_index = ai_index
+
+    def probabilities(self, texts: List[str], batch_size: Optional[int] = None, timer=None) -> np.ndarray:
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        batch_size = batch_size or DEFAULT_BATCH_SIZE
+        stage = timer.stage if timer is not None else _untimed
+
+        with stage("tokenize", size=len(texts)):
+            encoded = self.tokenizer(texts, truncation=True)["input_ids"]
+            lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+            order = np.argsort(lengths, kind="stable")
+        probs = np.empty(len(texts), dtype=np.float32)
+        pad_id = self.tokenizer.pad_token_id
+
+        with torch.inference_mode():
+            for b in range(0, len(order), batch_size):
+                idx = order[b:b + batch_size]
+                batch_lengths = lengths[idx]
+
+                with stage("pad", batch=b // batch_size, size=len(idx)) as info:
+                    width = int(batch_lengths.max())
+                    # Right padding, as the tokenizer would do
+                    input_ids = np.full((len(idx), width), pad_id, dtype=np.int64)
+                    for row, i in enumerate(idx):
+                        input_ids[row, :batch_lengths[row]] = encoded[i]
+                    attention_mask = (np.arange(width) < batch_lengths[:, None]).astype(np.int64)
+                    real = int(batch_lengths.sum())
+                    info.update(tokens=real, padded=input_ids.size - real)
+
+                with stage("forward", batch=b // batch_size, size=len(idx)):
+                    logits = self.model(
+                        input_ids=torch.from_numpy(input_ids).to(self.model.device),
+                        attention_mask=torch.from_numpy(attention_mask).to(self.model.device)
+                    ).logits
+
+                with stage("postprocess", batch=b // batch_size):
+                    probs[idx] = logits.float().softmax(dim=-1)[:, self.ai_index].cpu().numpy()
+
+        return probs
+
+
+# =========================
+# Parity check
+# =========================
+def load_segments(inputs: List[str], limit: int) -> List[str]:
+    from utils import clean_text, iter_documents, split_lines_with_offsets
+
+    texts = []
+    for p in inputs:
+        for _, doc in iter_documents(Path(p)):
+            texts += [clean_text(line) for line, _, _ in split_lines_with_offsets(doc.strip())]
+            if len(texts) >= limit:
+                return texts[:limit]
+    return texts
+
+
+def parity(texts: List[str], model: str, revision: Optional[str], batch_size: int, threshold: float) -> dict:
+    from registry import ModelHandle
+
+    pipeline_handle = ModelHandle(model, revision, -1, batch_size, backend="pipeline")
+    direct_handle = ModelHandle(model, revision, -1, batch_size, backend="direct")
+    pipeline_handle.warm()
+    direct_handle.warm()
+
+    timings = {}
+    results = {}
+    for name, handle in (("pipeline", pipeline_handle), ("direct", direct_handle)):
+        started = time.perf_counter()
+        results[name] = np.asarray(handle.classify(texts))
+        timings[name] = time.perf_counter() - started
+
+    diff = np.abs(results["pipeline"] - results["direct"])
+    agree = (results["pipeline"] > threshold) == (results["direct"] > threshold)
+
+    return {
+        "segments": len(texts),
+        "batch_size": batch_size,
+        "max_abs_diff": float(diff.max()) if len(texts) else 0.0,
+        "mean_abs_diff": float(diff.mean()) if len(texts) else 0.0,
+        "label_agreement": round(float(agree.mean()), 6) if len(texts) else 1.0,
+        "pipeline_s": round(timings["pipeline"], 3),
+        "direct_s": round(timings["direct"], 3),
+        "pipeline_us_per_segment": round(timings["pipeline"] / len(texts) * 1e6, 1) if texts else None,
+        "direct_us_per_segment": round(timings["direct"] / len(texts) * 1e6, 1) if texts else None,
+        "speedup": round(timings["pipeline"] / timings["direct"], 2) if timings["direct"] else None,
+    }
+
+
+if __name__ == "__main__":
+    from registry import AI_THRESHOLD, DEFAULT_MODEL
+
+    parser = argparse.ArgumentParser(description="Compare direct inference with the transformers pipeline")
+    parser.add_argument("inputs", nargs="*", help="Directories of .txt/.md files, JSONL or CSV files")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use this many synthetic segments instead")
+    parser.add_argument("--limit", type=int, default=2000, help="Segments to read from the inputs")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", DEFAULT_MODEL))
+    parser.add_argument("--revision", default=os.environ.get("MODEL_REVISION") or None)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from autotune import synthetic_segments
+        segments = synthetic_segments(args.synthetic)
+    elif args.inputs:
+        segments = load_segments(args.inputs, args.limit)
+    else:
+        parser.error("pass input files or --synthetic N")
+
+    report = parity(segments, args.model, args.revision, args.batch_size, AI_THRESHOLD)
+    print(json.dumps(report, indent=2))
+    if report["label_agreement"] < 1.0:
+        sys.exit(1)
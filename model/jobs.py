@@ -0,0 +1,348 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+# Job states. A "running" job whose lease expired belongs to a process that
+# died; it goes back to "queued" and the handler resumes from its last
+# saved partial.
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# How long an idle worker sleeps before polling the table again
+POLL_INTERVAL = 1.0
+
+# Running jobs hold a lease, renewed every LEASE_SECONDS / 3 by their process
+LEASE_SECONDS = 60
+
+# A job that has been started this many times without finishing (each
+# time its process died) is failed instead of being run again
+MAX_ATTEMPTS = 3
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobInterrupted(Exception):
+    """
+    Raised at a checkpoint when the queue is shutting down; the job is
+    requeued and resumes from its partial result.
+    """
+
+
+class JobContext:
+    """
+    Handed to a running handler to report progress and save partial results.
+    """
+
+    def __init__(self, queue: "JobQueue", job_id: str, partial: Optional[dict]):
+        self.queue = queue
+        self.job_id = job_id
+        self.partial = partial   # last saved partial result, set when resuming
+
+    def progress(self, done: int, total: int, partial: Optional[dict] = None):
+        """
+        Persist progress and, if given, a partial result. Raises JobCancelled
+        once cancellation has been requested and JobInterrupted on shutdown,
+        so handlers stop at the next checkpoint.
+        """
+        if partial is not None:
+            self.partial = partial
+        owned, cancel = self.queue._save_progress(self.job_id, done, total, partial)
+        if cancel:
+            raise JobCancelled()
+        # Lost the lease (another process took the job over) or shutting down
+        if not owned or self.queue._stop.is_set():
+            raise JobInterrupted()
+
+
+class JobQueue:
+    """
+    Durable job queue in SQLite, worked off by a pool of threads.
+
+    Handlers are registered per kind and called as handler(payload, ctx);
+    their return value becomes the job result. Jobs, progress and partial
+    results survive restarts.
+
+    Several processes (e.g. uvicorn workers) can share one database: jobs
+    are claimed with a conditional UPDATE, so only one process gets each,
+    and a claimed job is leased to its process. Only jobs whose lease ran
+    out are requeued, and writes from a process that lost the lease are
+    ignored.
+    """
+
+    def __init__(self, path: str, workers: int = 1, max_attempts: int = MAX_ATTEMPTS,
+                 lease: float = LEASE_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.owner = None
+        self.handlers: Dict[str, Callable[[dict, JobContext], dict]] = {}
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._init_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER,
+                    partial TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    lease_until REAL
+                )
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+
+    def register(self, kind: str, handler: Callable[[dict, JobContext], dict]):
+        self.handlers[kind] = handler
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    def start(self):
+        # Set here rather than in __init__ so forked processes get their own
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        requeued = self._recover()
+
+        self._stop.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        return requeued
+
+    def _recover(self) -> int:
+        """
+        Requeue running jobs whose lease expired, failing those that already
+        used up their attempts. Returns how many were requeued.
+        """
+        now = time.time()
+        expired = "status = ? AND (lease_until IS NULL OR lease_until < ?)"
+        with self._write_lock, self.conn:
+            self.conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, finished_at = ?, owner = NULL "
+                f"WHERE {expired} AND attempts >= ?",
+                (FAILED, f"Gave up after {self.max_attempts} attempts", now, RUNNING, now, self.max_attempts)
+            )
+            requeued = self.conn.execute(
+                f"UPDATE jobs SET status = ?, owner = NULL WHERE {expired}", (QUEUED, RUNNING, now)
+            ).rowcount
+            # Cancelled while its process was gone: nothing left to stop
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1",
+                (CANCELLED, now, QUEUED)
+            )
+        if requeued:
+            self._wake.set()
+        return requeued
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease / 3):
+            with self._write_lock, self.conn:
+                self.conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?",
+                    (time.time() + self.lease, self.owner, RUNNING)
+                )
+            self._recover()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop taking new jobs and interrupt running ones at their next
+        checkpoint. They are requeued and picked up again by any process.
+        """
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def purge(self, older_than: float) -> int:
+        """
+        Delete finished jobs that ended more than `older_than` seconds ago.
+        """
+        with self._write_lock, self.conn:
+            return self.conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))}) AND finished_at < ?",
+                (*FINISHED, time.time() - older_than)
+            ).rowcount
+
+    # -------------------------
+    # Client side
+    # -------------------------
+    def submit(self, kind: str, payload: dict) -> str:
+        if kind not in self.handlers:
+            raise KeyError(f"No handler for job kind {kind!r}")
+        job_id = uuid.uuid4().hex
+        with self._write_lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), time.time())
+            )
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        position = None
+        if row["status"] == QUEUED:
+            position = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                (QUEUED, row["created_at"])
+            ).fetchone()[0]
+
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "queue_position": position,
+            "progress": {"done": row["done"], "total": row["total"]},
+            "partial": json.loads(row["partial"]) if row["partial"] and row["status"] != DONE else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "cancel_requested": bool(row["cancel_requested"]),
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a queued job immediately, or ask a running one to stop at its
+        next progress report. Returns the resulting status, None if unknown.
+        """
+        with self._write_lock, self.conn:
+            row = self.conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status = row["status"]
+            if status == QUEUED:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (CANCELLED, time.time(), job_id)
+                )
+                return CANCELLED
+            if status == RUNNING:
+                self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return status
+
+    def stats(self) -> dict:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"workers": self.workers, **{status: count for status, count in rows}}
+
+    # -------------------------
+    # Worker side
+    # -------------------------
+    def _claim(self) -> Optional[sqlite3.Row]:
+        with self._write_lock, self.conn:
+            candidates = self.conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 8", (QUEUED,)
+            ).fetchall()
+            now = time.time()
+            for candidate in candidates:
+                # Only succeeds if no other process claimed it first
+                claimed = self.conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, owner = ?, "
+                    "lease_until = ? WHERE id = ? AND status = ?",
+                    (RUNNING, now, self.owner, now + self.lease, candidate["id"], QUEUED)
+                ).rowcount
+                if claimed:
+                    return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (candidate["id"],)).fetchone()
+        return None
+
+    def _save_progress(self, job_id: str, done: int, total: int, partial: Optional[dict]):
+        """
+        Returns (still owned by this process, cancellation requested).
+        """
+        with self._write_lock, self.conn:
+            owned = self.conn.execute(
+                "UPDATE jobs SET done = ?, total = ?, partial = COALESCE(?, partial), lease_until = ? "
+                "WHERE id = ? AND owner = ? AND status = ?",
+                (done, total, json.dumps(partial) if partial is not None else None,
+                 time.time() + self.lease, job_id, self.owner, RUNNING)
+            ).rowcount
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(owned), bool(row and row["cancel_requested"])
+
+    def _finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        with self._write_lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, owner = NULL "
+                "WHERE id = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(),
+                 job_id, self.owner)
+            )
+
+    def _requeue(self, job_id: str):
+        """
+        Hand an interrupted job back. A clean shutdown doesn't count as an attempt.
+        """
+        with self._write_lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, attempts = attempts - 1 WHERE id = ? AND owner = ?",
+                (QUEUED, job_id, self.owner)
+            )
+
+    def _work(self):
+        while not self._stop.is_set():
+            row = self._claim()
+            if row is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+
+            ctx = JobContext(self, row["id"], json.loads(row["partial"]) if row["partial"] else None)
+            try:
+                handler = self.handlers[row["kind"]]
+                result = handler(json.loads(row["payload"]), ctx)
+            except JobCancelled:
+                self._finish(row["id"], CANCELLED)
+            except JobInterrupted:
+                self._requeue(row["id"])
+            except Exception as e:
+                self._finish(row["id"], FAILED, error=f"{type(e).__name__}: {e}")
+            else:
+                self._finish(row["id"], DONE, result=result)
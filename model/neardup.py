@@ -0,0 +1,299 @@
+import argparse
+import hashlib
+import os
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+# =========================
+# MinHash
+# =========================
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+NUM_PERM = 64
+
+# Segments with fewer tokens than this only match exactly: a handful of
+# tokens gives too few shingles for the similarity estimate to be trusted.
+MIN_TOKENS = 8
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(1234)
+_PERM_A = _rng.randint(1, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _feature_hash(feature: str) -> int:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def minhash(tokens: List[str]) -> np.ndarray:
+    """
+    MinHash signature over word unigrams and bigrams.
+    """
+    features = set(tokens) | {a + " " + b for a, b in zip(tokens, tokens[1:])}
+    if not features:
+        return np.zeros(NUM_PERM, dtype=np.uint32)
+
+    hashes = np.array([_feature_hash(f) for f in features], dtype=np.uint64)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(signatures: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Estimated Jaccard similarity between one signature and a stack of signatures.
+    """
+    return (signatures == query).mean(axis=1)
+
+
+# =========================
+# Index
+# =========================
+# LSH banding: signatures are cut into BANDS bands of ROWS values, and only
+# segments sharing at least one whole band with the query are compared. A
+# pair at Jaccard similarity s becomes a candidate with probability
+# 1 - (1 - s^ROWS)^BANDS, ~0.9998 at 0.8 and ~0.64 at 0.5.
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_BAND_IDS = np.arange(BANDS)
+_BAND_MIX = np.random.RandomState(4321).randint(1, 1 << 62, size=ROWS, dtype=np.int64).astype(np.uint64)
+_BAND_MIX |= np.uint64(1)
+
+
+def _band_keys(signature: np.ndarray) -> np.ndarray:
+    """
+    One 64-bit hash per band; equal bands always get equal keys.
+    """
+    keys = (signature.reshape(BANDS, ROWS).astype(np.uint64) * _BAND_MIX).sum(axis=1)
+    return keys ^ (keys >> np.uint64(31))
+
+
+class NearDuplicateIndex:
+    """
+    Bounded in-memory index of recently classified segments.
+
+    Signatures and scores live in fixed-size NumPy arrays used as a ring
+    buffer, so the oldest entries are evicted once `capacity` is reached.
+    Lookups return the similarity-weighted score of stored segments at or
+    above `threshold`, or None on a miss. Segments without any word tokens
+    are never cached.
+
+    The band tables are NumPy arrays too: per band, a hash table of bucket
+    heads and doubly linked chains of slots, so an evicted slot is unlinked
+    in place. Everything is allocated up front, about 700 bytes per slot
+    (~35 MB at the default capacity).
+    """
+
+    def __init__(self, capacity: int = 50000, threshold: float = 0.8):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.signatures = np.zeros((capacity, NUM_PERM), dtype=np.uint32)
+        self.scores = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.cursor = 0
+        self.hits = 0
+        self.misses = 0
+        # At most half full, so chains stay short
+        table_size = 1 << max(4, (2 * capacity - 1).bit_length())
+        self._mask = np.uint64(table_size - 1)
+        self._band_keys = np.zeros((capacity, BANDS), dtype=np.uint64)
+        self._heads = np.full((BANDS, table_size), -1, dtype=np.int32)
+        self._next = np.full((capacity, BANDS), -1, dtype=np.int32)
+        self._prev = np.full((capacity, BANDS), -1, dtype=np.int32)
+        self._lock = threading.Lock()
+        # Bumped by clear(); inserts computed before a clear are dropped
+        self.generation = 0
+
+    def _key(self, text: str):
+        tokens = _tokens(text)
+        if not tokens:
+            return None
+        signature = minhash(tokens)
+        limit = self.threshold if len(tokens) >= MIN_TOKENS else 1.0
+        return signature, limit, _band_keys(signature)
+
+    def _buckets(self, keys: np.ndarray) -> np.ndarray:
+        return (keys & self._mask).astype(np.int64)
+
+    def _candidates(self, keys: np.ndarray) -> np.ndarray:
+        slots = set()
+        for band, bucket in enumerate(self._buckets(keys).tolist()):
+            node = int(self._heads[band, bucket])
+            while node >= 0:
+                if self._band_keys[node, band] == keys[band]:
+                    slots.add(node)
+                node = int(self._next[node, band])
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    @staticmethod
+    def _match(signature: np.ndarray, limit: float, signatures: np.ndarray, scores: np.ndarray) -> Optional[float]:
+        if len(scores) == 0:
+            return None
+
+        sim = similarity(signatures, signature)
+        near = np.flatnonzero(sim >= limit)
+        if near.size == 0:
+            return None
+
+        return float(np.average(scores[near], weights=sim[near]))
+
+    def lookup_many(self, texts: List[str]) -> List[Optional[float]]:
+        keys = [self._key(t) for t in texts]
+
+        # Only copy out the candidates under the lock, compare outside it
+        with self._lock:
+            candidates = []
+            for key in keys:
+                if key is None:
+                    candidates.append(None)
+                    continue
+                slots = self._candidates(key[2])
+                candidates.append((self.signatures[slots], self.scores[slots]))
+
+        found = [
+            self._match(key[0], key[1], *cand) if key is not None else None
+            for key, cand in zip(keys, candidates)
+        ]
+
+        cached = sum(1 for k in keys if k is not None)
+        hit_count = sum(1 for f in found if f is not None)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += cached - hit_count
+        return found
+
+    def add_many(self, texts: List[str], scores: List[float], generation: Optional[int] = None):
+        """
+        Store scores. With `generation` (read before the scores were
+        computed), nothing is stored if the index was cleared since.
+        """
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            for key, score in zip(keys, scores):
+                if key is None:
+                    continue
+                slot = self.cursor
+                if slot < self.size:
+                    self._unlink(slot)
+                self.signatures[slot] = key[0]
+                self.scores[slot] = score
+                self._link(slot, key[2])
+                self.cursor = (self.cursor + 1) % self.capacity
+                self.size = min(self.size + 1, self.capacity)
+
+    def _link(self, slot: int, keys: np.ndarray):
+        buckets = self._buckets(keys)
+        head = self._heads[_BAND_IDS, buckets]
+        self._band_keys[slot] = keys
+        self._next[slot] = head
+        self._prev[slot] = -1
+        linked = head >= 0
+        self._prev[head[linked], _BAND_IDS[linked]] = slot
+        self._heads[_BAND_IDS, buckets] = slot
+
+    def _unlink(self, slot: int):
+        buckets = self._buckets(self._band_keys[slot])
+        prev, nxt = self._prev[slot], self._next[slot]
+        first = prev < 0
+        self._heads[_BAND_IDS[first], buckets[first]] = nxt[first]
+        self._next[prev[~first], _BAND_IDS[~first]] = nxt[~first]
+        linked = nxt >= 0
+        self._prev[nxt[linked], _BAND_IDS[linked]] = prev[linked]
+
+    def clear(self):
+        with self._lock:
+            self.size = 0
+            self.cursor = 0
+            self._heads.fill(-1)
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": self.size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# =========================
+# Accuracy vs savings report
+# =========================
+def simulate(texts: List[str], scores: List[float], capacity: int, threshold: float) -> dict:
+    """
+    Replay classified segments through an index in order and compare reused
+    scores against the model's own scores.
+    """
+    from registry import AI_THRESHOLD
+
+    index = NearDuplicateIndex(capacity=capacity, threshold=threshold)
+    errors = []
+    flips = 0
+
+    for text, score in zip(texts, scores):
+        reused = index.lookup_many([text])[0]
+        if reused is None:
+            index.add_many([text], [score])
+            continue
+        errors.append(abs(reused - score))
+        if (reused > AI_THRESHOLD) != (score > AI_THRESHOLD):
+            flips += 1
+
+    hits = len(errors)
+    return {
+        "threshold": threshold,
+        "segments": len(texts),
+        "reused": hits,
+        "savings": round(hits / len(texts), 4) if texts else 0.0,
+        "mean_abs_error": round(float(np.mean(errors)), 4) if errors else 0.0,
+        "max_abs_error": round(float(np.max(errors)), 4) if errors else 0.0,
+        "label_flips": flips,
+    }
+
+
+def report(paths: List[str], capacity: int, thresholds: List[float], model: str, revision: Optional[str]):
+    from registry import ModelHandle
+    from utils import clean_text, split_lines_with_offsets
+
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            texts += [clean_text(s) for s, _, _ in split_lines_with_offsets(f.read())]
+
+    scores = ModelHandle(model, revision, -1).classify(texts)
+
+    print(f"{'threshold':>9} {'segments':>9} {'reused':>7} {'savings':>8} {'mae':>7} {'max_err':>8} {'flips':>6}")
+    for t in thresholds:
+        r = simulate(texts, scores, capacity, t)
+        print(f"{r['threshold']:>9.2f} {r['segments']:>9} {r['reused']:>7} {r['savings']:>8.2%} "
+              f"{r['mean_abs_error']:>7.4f} {r['max_abs_error']:>8.4f} {r['label_flips']:>6}")
+
+
+if __name__ == "__main__":
+    from registry import DEFAULT_MODEL
+
+    parser = argparse.ArgumentParser(
+        description="Report accuracy versus savings of near-duplicate score reuse on a corpus."
+    )
+    parser.add_argument("paths", nargs="+", help="Plain-text files, replayed in order")
+    parser.add_argument("--capacity", type=int, default=50000)
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", DEFAULT_MODEL))
+    parser.add_argument("--revision", default=os.environ.get("MODEL_REVISION") or None)
+    parser.add_argument("--thresholds", default="1.0,0.95,0.9,0.85,0.8,0.7,0.6",
+                        help="Comma-separated similarity thresholds to compare")
+    args = parser.parse_args()
+
+    report(args.paths, args.capacity, [float(t) for t in args.thresholds.split(",")], args.model, args.revision)
@@ -0,0 +1,328 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from utils import iter_documents
+
+# Run as a separate service on the port detector.ts expects by default:
+#   uvicorn plagiarism:app --host 0.0.0.0 --port 5000
+# Bulk-load an existing corpus:
+#   python plagiarism.py index submissions/ archive.jsonl
+
+# =========================
+# Config
+# =========================
+DB_PATH = os.environ.get("PLAGIARISM_DB", str(Path(__file__).parent / "plagiarism.db"))
+
+# Opt-in: submissions checked through /plagiarism are added to the index
+# afterwards, under the caller's `owner` so their later rewrites of the same
+# text don't match their own earlier submission
+INDEX_SUBMISSIONS = os.environ.get("PLAGIARISM_INDEX_SUBMISSIONS", "0") == "1"
+
+SHINGLE_WORDS = 5   # k: words per shingle
+WINDOW = 4          # w: winnowing window, any shared run of k + w - 1 words is found
+WINNOW_DENSITY = 2 / (WINDOW + 1)  # expected fraction of shingles kept
+# Shingles stored for more documents than this are boilerplate ("on the
+# other hand it"), carry no evidence and are skipped, which also bounds the
+# cost of a lookup regardless of corpus size
+MAX_POSTINGS = int(os.environ.get("PLAGIARISM_MAX_POSTINGS", 50))
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# =========================
+# Fingerprinting
+# =========================
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    return [(m.group().lower(), m.start(), m.end()) for m in TOKEN_RE.finditer(text)]
+
+
+def shingle_hashes(tokens: List[Tuple[str, int, int]]) -> List[int]:
+    """
+    Signed 64-bit hash of every k-word shingle, so it fits an SQLite INTEGER.
+    """
+    words = [t[0] for t in tokens]
+    hashes = []
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        shingle = " ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8")
+        digest = hashlib.blake2b(shingle, digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, "little", signed=True))
+    return hashes
+
+
+def winnow(hashes: List[int]) -> List[Tuple[int, int]]:
+    """
+    Winnowing: keep the rightmost minimal hash of every window of WINDOW
+    shingles. Returns (hash, shingle position) pairs.
+    """
+    windows = max(1, len(hashes) - WINDOW + 1) if hashes else 0
+    picked = []
+    last = -1
+    for start in range(windows):
+        window = hashes[start:start + WINDOW]
+        low = min(window)
+        pos = start + max(i for i, h in enumerate(window) if h == low)
+        if pos != last:
+            picked.append((low, pos))
+            last = pos
+    return picked
+
+
+def digest_text(text: str) -> str:
+    normalized = " ".join(t[0] for t in tokenize(text))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+# =========================
+# Index
+# =========================
+class FingerprintIndex:
+    """
+    Inverted index from winnowed shingle hashes to documents, stored in SQLite.
+
+    The fingerprint table is clustered on the hash, so a lookup costs a
+    B-tree descent per query shingle regardless of corpus size.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._init_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    digest TEXT NOT NULL UNIQUE,
+                    created_at REAL NOT NULL,
+                    owner TEXT
+                )
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]
+            if "owner" not in columns:
+                self.conn.execute("ALTER TABLE documents ADD COLUMN owner TEXT")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    hash INTEGER NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    pos INTEGER NOT NULL,
+                    PRIMARY KEY (hash, doc_id, pos)
+                ) WITHOUT ROWID
+            """)
+
+    def add_many(self, docs: List[Tuple[str, str]], owner: Optional[str] = None) -> int:
+        """
+        Index (source, text) pairs in one transaction. Documents already in
+        the index (same normalized text) are skipped. Returns how many were added.
+        """
+        prepared = []
+        for source, text in docs:
+            fingerprints = winnow(shingle_hashes(tokenize(text)))
+            if fingerprints:
+                prepared.append((source, digest_text(text), fingerprints))
+
+        added = 0
+        with self._write_lock, self.conn:
+            for source, digest, fingerprints in prepared:
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO documents (source, digest, created_at, owner) VALUES (?, ?, ?, ?)",
+                    (source, digest, time.time(), owner)
+                )
+                if cur.rowcount == 0:
+                    continue
+                doc_id = cur.lastrowid
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO fingerprints (hash, doc_id, pos) VALUES (?, ?, ?)",
+                    [(h, doc_id, pos) for h, pos in fingerprints]
+                )
+                added += 1
+        return added
+
+    def lookup(self, hashes: List[int], exclude_owner: Optional[str] = None) -> Dict[int, Set[str]]:
+        """
+        Map each hash found in the index to the sources containing it,
+        leaving out documents of `exclude_owner` and hashes with more than
+        MAX_POSTINGS documents. A verbatim copy of someone else's document
+        must still match, so identical text is not excluded.
+        """
+        postings: Dict[int, Set[str]] = {}
+
+        for h in set(hashes):
+            rows = self.conn.execute(
+                """
+                SELECT d.source, d.owner FROM fingerprints f
+                JOIN documents d ON d.id = f.doc_id
+                WHERE f.hash = ?
+                LIMIT ?
+                """,
+                (h, MAX_POSTINGS + 1)
+            ).fetchall()
+            if len(rows) > MAX_POSTINGS:
+                continue
+            sources = {source for source, owner in rows if owner is None or owner != exclude_owner}
+            if sources:
+                postings[h] = sources
+        return postings
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def find_matches(index: FingerprintIndex, text: str, owner: Optional[str] = None) -> dict:
+    """
+    Compare every shingle of `text` against the index and merge matching
+    shingles into highlighted character spans.
+    """
+    tokens = tokenize(text)
+    hashes = shingle_hashes(tokens)
+    if not hashes:
+        return {"plagiarism_score": 0.0, "highlights": []}
+
+    postings = index.lookup(hashes, exclude_owner=owner)
+
+    # Stored documents only keep one fingerprint per WINDOW shingles, so
+    # matched shingles that are at most WINDOW apart belong to one passage.
+    spans = []
+    for pos, h in enumerate(hashes):
+        sources = postings.get(h)
+        if not sources:
+            continue
+        first, last = pos, pos + SHINGLE_WORDS - 1
+        if spans and first - spans[-1]["last_shingle"] <= WINDOW:
+            span = spans[-1]
+            span["last"] = last
+            span["last_shingle"] = pos
+            span["matched"] += 1
+            span["sources"] |= sources
+        else:
+            spans.append({
+                "first": first, "last": last, "first_shingle": pos,
+                "last_shingle": pos, "matched": 1, "sources": set(sources)
+            })
+
+    highlights = []
+    covered = 0
+    for span in spans:
+        start = tokens[span["first"]][1]
+        end = tokens[span["last"]][2]
+        shingles = span["last_shingle"] - span["first_shingle"] + 1
+        covered += end - start
+        highlights.append({
+            "start": start,
+            "end": end,
+            "text": text[start:end],
+            "confidence": round(min(1.0, span["matched"] / (shingles * WINNOW_DENSITY)), 4),
+            "sources": sorted(span["sources"]),
+        })
+
+    return {
+        "plagiarism_score": round(covered / len(text), 4) if text else 0.0,
+        "highlights": highlights,
+    }
+
+
+# =========================
+# FastAPI
+# =========================
+app = FastAPI()
+index = FingerprintIndex(DB_PATH)
+
+
+class PlagiarismRequest(BaseModel):
+    text: str
+    source: Optional[str] = None
+    owner: Optional[str] = None   # user or conversation; never matched against its own documents
+
+
+class Highlight(BaseModel):
+    start: int
+    end: int
+    text: str
+    confidence: float
+    sources: List[str]
+
+
+class PlagiarismResponse(BaseModel):
+    plagiarism_score: float
+    highlights: List[Highlight]
+
+
+@app.post("/plagiarism", response_model=PlagiarismResponse)
+def plagiarism(req: PlagiarismRequest):
+    result = find_matches(index, req.text, req.owner)
+
+    if INDEX_SUBMISSIONS and req.text.strip():
+        source = req.source or f"submission:{digest_text(req.text)[:12]}"
+        index.add_many([(source, req.text)], owner=req.owner)
+
+    return result
+
+
+@app.get("/plagiarism/stats")
+def plagiarism_stats():
+    return {"documents": index.count()}
+
+
+# =========================
+# Bulk indexing
+# =========================
+def bulk_index(paths: List[str], db: str, batch_size: int):
+    idx = FingerprintIndex(db)
+    started = time.perf_counter()
+    seen = added = 0
+    batch = []
+
+    def flush():
+        nonlocal added
+        added += idx.add_many(batch)
+        batch.clear()
+
+    for p in paths:
+        for doc in iter_documents(Path(p)):
+            batch.append(doc)
+            seen += 1
+            if len(batch) >= batch_size:
+                flush()
+                print(f"{seen} documents read, {added} added", file=sys.stderr)
+    flush()
+
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {added} new of {seen} documents in {elapsed:.1f}s "
+          f"({idx.count()} documents in {db})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local plagiarism fingerprint index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_index = sub.add_parser("index", help="Bulk-index directories, JSONL or CSV files")
+    p_index.add_argument("paths", nargs="+")
+    p_index.add_argument("--db", default=DB_PATH)
+    p_index.add_argument("--batch-size", type=int, default=500)
+
+    args = parser.parse_args()
+    if args.command == "index":
+        bulk_index(args.paths, args.db, args.batch_size)
@@ -0,0 +1,82 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import List
+
+import torch
+
+from inference import DEFAULT_BATCH_SIZE
+from registry import ModelHandle
+
+# Chrome traces of profiled requests are written here when set
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+
+class StageTimer:
+    """
+    Collects wall-clock timings of named stages for one request.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.tokens = None
+        self.trace = None
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, **info):
+        started = time.perf_counter()
+        try:
+            yield info
+        finally:
+            info = {k: v for k, v in info.items() if v is not None}
+            self.stages.append({"stage": name, "ms": round((time.perf_counter() - started) * 1000, 3), **info})
+
+    def summary(self, **extra) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages": self.stages,
+            "tokens": self.tokens,
+            "trace": self.trace,
+            **extra,
+        }
+
+
+def profile_classify(handle: ModelHandle, texts: List[str], timer: StageTimer) -> List[float]:
+    """
+    Classify `texts` through the direct backend with its stages recorded in
+    `timer`, and sum up real versus padding tokens.
+    """
+    batch_size = handle.batch_size or DEFAULT_BATCH_SIZE
+
+    with _trace(timer):
+        probs = handle.direct.probabilities(texts, batch_size, timer=timer)
+
+    pads = [s for s in timer.stages if s["stage"] == "pad"]
+    real_tokens = sum(s["tokens"] for s in pads)
+    padded_tokens = sum(s["padded"] for s in pads)
+    total = real_tokens + padded_tokens
+    timer.tokens = {
+        "batch_size": batch_size,
+        "real": real_tokens,
+        "padding": padded_tokens,
+        "padding_waste": round(padded_tokens / total, 4) if total else 0.0,
+    }
+    return probs.tolist()
+
+
+@contextmanager
+def _trace(timer: StageTimer):
+    if not PROFILE_DIR:
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"detect-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+    with torch.profiler.profile(
+        activities=[torch.profiler.ProfilerActivity.CPU],
+        record_shapes=True
+    ) as prof:
+        yield
+    prof.export_chrome_trace(path)
+    timer.trace = path
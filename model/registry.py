@@ -0,0 +1,322 @@
+import ctypes
+import gc
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from transformers import pipeline
+
+from inference import DirectClassifier
+
+DEFAULT_MODEL = "fakespot-ai/roberta-base-ai-text-detection-v1"
+
+# Segments scoring above this AI probability count as AI-written
+AI_THRESHOLD = 0.5
+
+# "direct" runs the tokenizer and model without the pipeline's per-item
+# processing; "pipeline" is kept to check parity against (see inference.py)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "direct")
+
+# Sentences of typical lengths run through a freshly loaded model before it
+# takes traffic, so the first real requests don't pay for lazy initialisation.
+WARMUP_TEXTS = [
+    "Thanks for the update.",
+    "The results of the experiment suggest that further research is needed to confirm these findings.",
+    "In conclusion, artificial intelligence has transformed many industries, offering new opportunities "
+    "for innovation while also raising important ethical questions that society must carefully address.",
+]
+WARMUP_ROUNDS = 2
+
+# How long to wait for in-flight requests to drop a replaced model
+RELEASE_TIMEOUT = 120
+
+
+def ai_probability(out: dict) -> float:
+    """
+    Normalize confidence so it always means AI probability.
+    """
+    label = out["label"].lower()
+    score = out["score"]
+
+    if label.startswith("ai"):
+        return score
+    else:
+        return 1 - score
+
+
+def ai_label_index(config) -> int:
+    """
+    Index of the AI class in the model's logits, looked up from id2label.
+    """
+    for idx, label in config.id2label.items():
+        if str(label).lower().startswith("ai"):
+            return int(idx)
+    raise ValueError(f"No AI label in id2label: {config.id2label}")
+
+
+class ModelHandle:
+    """
+    A loaded classifier together with the revision it was loaded from.
+    batch_size is the default for classify(), None keeps the pipeline's.
+    """
+
+    def __init__(self, name: str, revision: Optional[str], device: int, batch_size: Optional[int] = None,
+                 backend: str = INFERENCE_BACKEND):
+        if backend not in ("direct", "pipeline"):
+            raise ValueError(f"Unknown inference backend {backend!r}")
+        self.name = name
+        self.revision = revision
+        self.backend = backend
+        self.batch_size = batch_size
+        self.classifier = pipeline(
+            "text-classification",
+            model=name,
+            revision=revision,
+            device=device,
+            batch_size=batch_size
+        )
+        self.direct = DirectClassifier(
+            self.classifier.tokenizer, self.classifier.model, ai_label_index(self.classifier.model.config)
+        )
+        self.loaded_at = time.time()
+
+    def classify(self, texts: List[str], batch_size: Optional[int] = None) -> List[float]:
+        if not texts:
+            return []
+        if self.backend == "direct":
+            return self.direct.probabilities(texts, batch_size or self.batch_size).tolist()
+        outputs = self.classifier(texts, batch_size=batch_size, truncation=True)
+        return [ai_probability(out) for out in outputs]
+
+    def warm(self):
+        for _ in range(WARMUP_ROUNDS):
+            self.classify(WARMUP_TEXTS)
+
+    def describe(self) -> dict:
+        return {"model": self.name, "revision": self.revision, "backend": self.backend, "loaded_at": self.loaded_at}
+
+
+class ShadowStats:
+    """
+    Latency and agreement of the candidate model against the live one.
+    """
+
+    def __init__(self, threshold: float, window: int = 1000):
+        self.threshold = threshold
+        self.requests = 0
+        self.segments = 0
+        self.agreements = 0
+        self.abs_diff_sum = 0.0
+        self.skipped = 0
+        self.primary_ms = deque(maxlen=window)
+        self.candidate_ms = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, primary: List[float], candidate: List[float], primary_ms: float, candidate_ms: float):
+        with self._lock:
+            self.requests += 1
+            self.segments += len(primary)
+            for p, c in zip(primary, candidate):
+                self.agreements += (p > self.threshold) == (c > self.threshold)
+                self.abs_diff_sum += abs(p - c)
+            self.primary_ms.append(primary_ms)
+            self.candidate_ms.append(candidate_ms)
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def summary(self) -> dict:
+        def percentiles(values):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return {
+                "p50": round(ordered[len(ordered) // 2], 2),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            }
+
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "segments": self.segments,
+                "skipped": self.skipped,
+                "agreement": round(self.agreements / self.segments, 4) if self.segments else None,
+                "mean_abs_diff": round(self.abs_diff_sum / self.segments, 4) if self.segments else None,
+                "primary_ms": percentiles(self.primary_ms),
+                "candidate_ms": percentiles(self.candidate_ms),
+            }
+
+
+def release_memory():
+    """
+    Collect garbage and hand freed heap pages back to the OS where glibc allows it.
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class ModelRegistry:
+    """
+    Holds the live model and an optional candidate.
+
+    Requests take `registry.current` once and keep using that handle, so
+    replacing it is a single attribute assignment and in-flight requests
+    finish on the model they started with. A candidate can be loaded in
+    the background and either swapped in once warm or run in shadow mode
+    on a sampled fraction of traffic.
+    """
+
+    def __init__(self, handle: ModelHandle, device: int, threshold: float, batch_size: Optional[int] = None):
+        self.current = handle
+        self.candidate: Optional[ModelHandle] = None
+        self.device = device
+        self.batch_size = batch_size
+        self.threshold = threshold
+        self.shadow_fraction = 0.0
+        self.shadow_stats: Optional[ShadowStats] = None
+        self.loading: Optional[dict] = None
+        self.on_swap: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_busy = threading.Semaphore(1)
+
+    # -------------------------
+    # Inference
+    # -------------------------
+    def classify(self, texts: List[str]) -> List[float]:
+        handle = self.current
+        started = time.perf_counter()
+        probs = handle.classify(texts)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        candidate = self.candidate
+        if candidate is not None and texts and random.random() < self.shadow_fraction:
+            self._shadow(candidate, texts, probs, elapsed_ms)
+        return probs
+
+    def _shadow(self, candidate: ModelHandle, texts: List[str], primary: List[float], primary_ms: float):
+        stats = self.shadow_stats
+        # Never queue shadow work: if the candidate is still busy, drop the sample
+        if not self._shadow_busy.acquire(blocking=False):
+            stats.skip()
+            return
+
+        def run():
+            try:
+                started = time.perf_counter()
+                shadow = candidate.classify(texts)
+                stats.record(primary, shadow, primary_ms, (time.perf_counter() - started) * 1000)
+            finally:
+                self._shadow_busy.release()
+
+        self._shadow_pool.submit(run)
+
+    # -------------------------
+    # Revisions
+    # -------------------------
+    def load_async(self, name: str, revision: Optional[str], shadow_fraction: float = 0.0) -> bool:
+        """
+        Load and warm a revision in the background. With shadow_fraction > 0
+        it becomes the shadow candidate, otherwise it replaces the live model.
+        Returns False if another load is already running.
+        """
+        with self._lock:
+            if self.loading and self.loading["state"] == "loading":
+                return False
+            self.loading = {
+                "state": "loading", "model": name, "revision": revision,
+                "mode": "shadow" if shadow_fraction > 0 else "swap",
+                "started_at": time.time(), "error": None,
+            }
+
+        def run():
+            try:
+                handle = ModelHandle(name, revision, self.device, self.batch_size)
+                handle.warm()
+            except Exception as e:
+                self.loading.update(state="failed", error=str(e))
+                release_memory()
+                return
+
+            if shadow_fraction > 0:
+                self.set_candidate(handle, shadow_fraction)
+            else:
+                self.swap(handle)
+            self.loading.update(state="ready", finished_at=time.time())
+
+        threading.Thread(target=run, name="model-loader", daemon=True).start()
+        return True
+
+    def set_candidate(self, handle: ModelHandle, shadow_fraction: float):
+        with self._lock:
+            old = self.candidate
+            self.shadow_stats = ShadowStats(self.threshold)
+            self.shadow_fraction = shadow_fraction
+            self.candidate = handle
+        if old is not None:
+            self._release(old)
+
+    def swap(self, handle: ModelHandle):
+        with self._lock:
+            old = self.current
+            self.current = handle
+        for callback in self.on_swap:
+            callback()
+        self._release(old)
+
+    def promote(self) -> bool:
+        with self._lock:
+            candidate = self.candidate
+            if candidate is None:
+                return False
+            self.candidate = None
+            self.shadow_fraction = 0.0
+        self.swap(candidate)
+        return True
+
+    def discard_candidate(self) -> bool:
+        with self._lock:
+            old = self.candidate
+            self.candidate = None
+            self.shadow_fraction = 0.0
+        if old is None:
+            return False
+        self._release(old)
+        return True
+
+    def _release(self, handle: ModelHandle):
+        """
+        Drop our reference and, once in-flight requests let go of the handle
+        too, return its memory to the OS.
+        """
+        ref = weakref.ref(handle)
+        del handle
+
+        def wait():
+            deadline = time.monotonic() + RELEASE_TIMEOUT
+            while ref() is not None and time.monotonic() < deadline:
+                gc.collect()
+                time.sleep(0.5)
+            release_memory()
+
+        threading.Thread(target=wait, name="model-release", daemon=True).start()
+
+    def status(self) -> dict:
+        candidate = self.candidate
+        stats = self.shadow_stats
+        return {
+            "current": self.current.describe(),
+            "candidate": candidate.describe() if candidate else None,
+            "shadow_fraction": self.shadow_fraction,
+            "shadow": stats.summary() if candidate and stats else None,
+            "loading": self.loading,
+        }
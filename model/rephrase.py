@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from utils import clean_text, split_lines_with_offsets
+
+# The rule-based humanizer lives with the frontend; it is imported from
+# there on first use so the detection service runs without its NLP deps.
+# It needs the packages in requirements-humanizer.txt plus NLTK punkt_tab
+# and wordnet and spaCy en_core_web_sm; the Dockerfile installs all of it
+# when built with the `humanizer` context.
+HUMANIZER_DIR = os.environ.get(
+    "HUMANIZER_DIR",
+    str(Path(__file__).resolve().parent.parent / "frontend" / "detectors")
+)
+
+# Each retry of a still-flagged sentence raises synonym intensity by this much
+SYNONYM_STEP = 0.1
+
+# Flagged sentences are humanized and re-scored this many at a time; the
+# time budget is checked between chunks, not only between rounds
+ROUND_CHUNK = 16
+
+_humanizer = None
+
+
+def load_humanizer():
+    global _humanizer
+    if _humanizer is None:
+        if HUMANIZER_DIR not in sys.path:
+            sys.path.append(HUMANIZER_DIR)
+        import humanize_core
+        _humanizer = humanize_core
+    return _humanizer
+
+
+def humanize_sentence(humanizer, text: str, p_syn: float, p_trans: float) -> str:
+    """
+    Run one segment through the humanizer the same way humanize_cli.py does.
+    """
+    return humanizer.humanize(text, p_syn=p_syn, p_trans=p_trans).strip()
+
+
+def split_pieces(text: str):
+    """
+    Split text into segments, keeping the exact text between them so the
+    document can be reassembled after individual segments are rewritten.
+    """
+    pieces = []
+    pos = 0
+    for core, start, end in split_lines_with_offsets(text):
+        raw = text[start:end]
+        core_start = start + len(raw) - len(raw.lstrip())
+        pieces.append({"prefix": text[pos:core_start], "text": core})
+        pos = core_start + len(core)
+    return pieces, text[pos:]
+
+
+def assemble(pieces, tail: str, scores: List[float]):
+    """
+    Rebuild the document from its (possibly rewritten) pieces, returning
+    the text and every segment's span in it with its score.
+    """
+    out = []
+    lines = []
+    pos = 0
+    for piece, score in zip(pieces, scores):
+        pos += len(piece["prefix"])
+        lines.append({
+            "text": piece["text"],
+            "start": pos,
+            "end": pos + len(piece["text"]),
+            "confidence": round(score, 4),
+        })
+        pos += len(piece["text"])
+        out += [piece["prefix"], piece["text"]]
+    out.append(tail)
+    return "".join(out), lines
+
+
+def rephrase_until_human(
+    text: str,
+    classify: Callable[[List[str]], List[float]],
+    p_syn: float = 0.2,
+    p_trans: float = 0.2,
+    threshold: float = 0.5,
+    max_iterations: int = 3,
+    time_budget_ms: int = 20000,
+    on_progress: Optional[Callable[[int, int, dict], None]] = None,
+    resume: Optional[dict] = None,
+) -> dict:
+    """
+    Humanize only the segments the classifier still flags, re-scoring just
+    those after every round, until none are flagged or the iteration or
+    time budget runs out. Each segment keeps its lowest-scoring version.
+
+    `classify` should run the model itself: a rewrite is a near-duplicate
+    of its original, so a similarity cache would hand back the old score.
+
+    on_progress(done, total, partial) is called after the initial scoring
+    and after every ROUND_CHUNK reworked segments; it may raise to abort.
+    Progress counts segment slots over all rounds (max_iterations times
+    the segment count). Passing a saved partial as `resume` continues from
+    its last completed chunk, in the middle of a round if need be.
+    """
+    humanizer = load_humanizer()
+    started = time.perf_counter()
+    deadline = started + time_budget_ms / 1000
+
+    pieces, tail = split_pieces(text)
+    originals = [p["text"] for p in pieces]
+    if resume:
+        for piece, line in zip(pieces, resume["lines"]):
+            piece["text"] = line["text"]
+        scores = [line["confidence"] for line in resume["lines"]]
+        iterations = list(resume["iterations"])
+        current = resume.get("round")
+    else:
+        scores = classify([clean_text(t) for t in originals])
+        iterations = []
+        current = None
+
+    def report():
+        if on_progress:
+            humanized, lines = assemble(pieces, tail, scores)
+            done = len(iterations) * len(pieces) + (current["reworked"] if current else 0)
+            on_progress(done, max_iterations * len(pieces), {
+                "humanized_text": humanized, "lines": lines, "iterations": iterations, "round": current
+            })
+
+    report()
+
+    for it in range(len(iterations), max_iterations):
+        if current is None:
+            flagged = [i for i, s in enumerate(scores) if s > threshold]
+            if not flagged or time.perf_counter() >= deadline:
+                break
+            # The round in progress, saved with every report
+            current = {"flagged": flagged, "reworked": 0, "improved": 0, "ms": 0.0}
+
+        syn = min(1.0, p_syn + it * SYNONYM_STEP)
+        flagged = current["flagged"]
+        while current["reworked"] < len(flagged) and time.perf_counter() < deadline:
+            chunk_started = time.perf_counter()
+            chunk = flagged[current["reworked"]:current["reworked"] + ROUND_CHUNK]
+            candidates = [humanize_sentence(humanizer, originals[i], syn, p_trans) for i in chunk]
+            new_scores = classify([clean_text(c) for c in candidates])
+
+            for i, candidate, score in zip(chunk, candidates, new_scores):
+                if candidate and score < scores[i]:
+                    pieces[i]["text"] = candidate
+                    scores[i] = score
+                    current["improved"] += 1
+            current["reworked"] += len(chunk)
+            current["ms"] += (time.perf_counter() - chunk_started) * 1000
+            if current["reworked"] < len(flagged):
+                report()
+
+        iterations.append({
+            "iteration": it + 1,
+            "reworked": current["reworked"],
+            "improved": current["improved"],
+            "still_flagged": sum(1 for s in scores if s > threshold),
+            "ms": round(current["ms"], 1),
+        })
+        current = None
+        report()
+
+    humanized, lines = assemble(pieces, tail, scores)
+    remaining = sum(1 for s in scores if s > threshold)
+    return {
+        "humanized_text": humanized,
+        "lines": lines,
+        "iterations": iterations,
+        "stats": {
+            "segments": len(pieces),
+            "iterations": len(iterations),
+            "reworked": sum(r["reworked"] for r in iterations),
+            "still_flagged": remaining,
+            "converged": remaining == 0,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+    }
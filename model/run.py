@@ -1,13 +1,22 @@
 import torch
-import re
+import numpy as np
 import os
+import json
+import time
+from contextlib import asynccontextmanager, nullcontext
 from pathlib import Path
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException
 from pydantic import BaseModel
-from transformers import pipeline
-from typing import List
+from typing import List, Literal, NamedTuple, Optional
 
-from utils import clean_text
+from autotune import apply_config, load_config, load_or_autotune
+from jobs import DONE, FAILED, JobQueue
+from neardup import NearDuplicateIndex
+from profiling import StageTimer, profile_classify
+from rephrase import rephrase_until_human
+from registry import AI_THRESHOLD, DEFAULT_MODEL, ModelHandle, ModelRegistry
+from sampling import StratifiedEstimator
+from utils import clean_text, split_lines_with_offsets, token_windows
 
 # =========================
 # Device
@@ -18,20 +27,121 @@ DEVICE = -1
 # Model
 # =========================
 # Download model directly from Hugging Face (avoids local file issues)
-classifier = pipeline(
-    "text-classification",
-    model="fakespot-ai/roberta-base-ai-text-detection-v1",
-    device=DEVICE
+MODEL_NAME = os.environ.get("MODEL_NAME", DEFAULT_MODEL)
+MODEL_REVISION = os.environ.get("MODEL_REVISION") or None
+
+# =========================
+# Tuning
+# =========================
+# Thread pools and batch size come from this host's `python autotune.py`
+# result when there is one, picked for the number of server processes
+# actually running (uvicorn's WEB_CONCURRENCY / UVICORN_WORKERS, else 1).
+# AUTOTUNE_ON_STARTUP=1 runs a quick sweep first if the host has not been
+# tuned yet; BATCH_SIZE overrides the tuned value.
+AUTOTUNE_CONFIG = os.environ.get("AUTOTUNE_CONFIG") or None
+AUTOTUNE_ON_STARTUP = os.environ.get("AUTOTUNE_ON_STARTUP", "0") == "1"
+SERVER_WORKERS = int(os.environ.get("WEB_CONCURRENCY") or os.environ.get("UVICORN_WORKERS") or 1)
+
+if AUTOTUNE_ON_STARTUP:
+    tuning = load_or_autotune(MODEL_NAME, MODEL_REVISION, SERVER_WORKERS, AUTOTUNE_CONFIG)
+else:
+    tuning = load_config(AUTOTUNE_CONFIG)
+tuned = apply_config(tuning, SERVER_WORKERS) if tuning is not None else None
+
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 0)) or (tuned["batch_size"] if tuned else None)
+
+# The live model can be replaced at runtime through /admin/model
+registry = ModelRegistry(
+    ModelHandle(MODEL_NAME, MODEL_REVISION, DEVICE, BATCH_SIZE),
+    device=DEVICE,
+    threshold=AI_THRESHOLD,
+    batch_size=BATCH_SIZE
+)
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# =========================
+# Near-duplicate score reuse
+# =========================
+# Lightly reworded copies of recently classified segments reuse their score
+# instead of going through the model. NEARDUP_CAPACITY=0 disables it.
+NEARDUP_CAPACITY = int(os.environ.get("NEARDUP_CAPACITY", 50000))
+NEARDUP_THRESHOLD = float(os.environ.get("NEARDUP_THRESHOLD", 0.8))
+
+score_index = (
+    NearDuplicateIndex(capacity=NEARDUP_CAPACITY, threshold=NEARDUP_THRESHOLD)
+    if NEARDUP_CAPACITY > 0 else None
 )
 
+# Cached scores belong to the model that produced them
+if score_index is not None:
+    registry.on_swap.append(score_index.clear)
+
+# =========================
+# Over-length segments
+# =========================
+# Segments longer than WINDOW_TOKENS are classified as overlapping windows
+# of that many tokens, batched together with the other segments, so no
+# item exceeds the model's 512 positions and per-item cost stays bounded.
+WINDOW_TOKENS = int(os.environ.get("WINDOW_TOKENS", 256))
+WINDOW_STRIDE = int(os.environ.get("WINDOW_STRIDE", 64))
+
+if not 0 <= WINDOW_STRIDE < WINDOW_TOKENS:
+    raise ValueError(
+        f"WINDOW_STRIDE ({WINDOW_STRIDE}) must be at least 0 and smaller than WINDOW_TOKENS ({WINDOW_TOKENS})"
+    )
+
+# =========================
+# Estimate mode
+# =========================
+# mode="estimate" scores a length-stratified sample of segments and returns
+# the AI coverage percentage with a confidence interval instead of every
+# highlight. Refinement rounds add ESTIMATE_ROUND_SIZE segments each.
+ESTIMATE_STRATA = int(os.environ.get("ESTIMATE_STRATA", 4))
+ESTIMATE_ROUND_SIZE = int(os.environ.get("ESTIMATE_ROUND_SIZE", 16))
+
+# =========================
+# Background jobs
+# =========================
+# Large documents can be submitted through /jobs/* instead of holding an
+# HTTP request open. Jobs are kept in SQLite and resume after a restart;
+# every uvicorn worker runs its own job threads on the shared database.
+JOBS_DB = os.environ.get("JOBS_DB", str(Path(__file__).parent / "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+JOB_CHUNK_SEGMENTS = int(os.environ.get("JOB_CHUNK_SEGMENTS", 64))   # segments between checkpoints
+JOB_RETENTION_HOURS = float(os.environ.get("JOB_RETENTION_HOURS", 168))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))        # starts before a crashing job is failed
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))   # a dead worker's jobs are requeued after this
+
+jobs = JobQueue(JOBS_DB, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS, lease=JOB_LEASE_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    jobs.purge(JOB_RETENTION_HOURS * 3600)
+    jobs.start()
+    yield
+    jobs.stop()
+
+
 # =========================
 # FastAPI
 # =========================
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 class DetectRequest(BaseModel):
     text: str
+    profile: bool = False   # admin only: include a stage-by-stage timing breakdown
+    # Over-length segments: one averaged score per segment, or one line per window
+    windows: Literal["aggregate", "spans"] = "aggregate"
+    # "estimate": sampled coverage estimate, lines only covers sampled segments
+    mode: Literal["full", "estimate"] = "full"
+    sample_size: int = 32                   # segments scored before refining
+    target_width: Optional[float] = None    # refine until the interval is this narrow (percentage points)
+    time_budget_ms: Optional[int] = None    # or until this much time is spent
+    confidence: float = 0.95
 
 
 class LineResult(BaseModel):
@@ -43,65 +153,399 @@ class LineResult(BaseModel):
 
 class DetectResponse(BaseModel):
     lines: List[LineResult]
+    profile: Optional[dict] = None
+    estimate: Optional[dict] = None
+
+
+class RephraseRequest(BaseModel):
+    text: str
+    p_syn: float = 0.2
+    p_trans: float = 0.2
+    threshold: float = AI_THRESHOLD
+    max_iterations: int = 3
+    time_budget_ms: int = 20000
+
+
+class RephraseResponse(BaseModel):
+    humanized_text: str
+    lines: List[LineResult]   # every segment of humanized_text with its AI probability
+    iterations: List[dict]
+    stats: dict
+
+
+class DetectJobRequest(BaseModel):
+    text: str
+    windows: Literal["aggregate", "spans"] = "aggregate"
+
+
+class JobSubmitted(BaseModel):
+    id: str
+    status: str
+
+
+class ModelLoadRequest(BaseModel):
+    model: str
+    revision: Optional[str] = None
+    shadow_fraction: float = 0.0   # > 0 loads as shadow candidate instead of swapping
 
 
 # =========================
 # Utilities
 # =========================
-def split_lines_with_offsets(text: str):
-    pattern = re.compile(r'[^.!?]+[.!?]?', re.MULTILINE)
-    for m in pattern.finditer(text):
-        s = m.group().strip()
-        if s:
-            yield s, m.start(), m.end()
-
-
-def is_ai(out: dict) -> bool:
+def classify(texts: List[str]) -> List[float]:
     """
-    Determine if model classified line as AI.
+    Run the live model on cleaned segments and return their AI probabilities.
     """
-    label = out["label"].lower()
-    return label.startswith("ai")
+    return registry.classify(texts)
 
 
-def ai_probability(out: dict) -> float:
+def classify_cached(texts: List[str], classify_fn=classify, timer: Optional[StageTimer] = None) -> List[float]:
     """
-    Normalize confidence so it always means AI probability.
+    Like classify, but reuses scores of near-duplicate segments seen recently.
+    With a timer, the cache lookup and insert are recorded as stages.
     """
-    label = out["label"].lower()
-    score = out["score"]
+    if score_index is None:
+        return classify_fn(texts)
+
+    def stage(name):
+        return timer.stage(name) if timer else nullcontext({})
+
+    # Read before classifying: if the model is swapped meanwhile, these
+    # scores come from the old one and must not be cached for the new one
+    generation = score_index.generation
+    with stage("neardup") as info:
+        probs = score_index.lookup_many(texts)
+        missing = [i for i, p in enumerate(probs) if p is None]
+        info.update(hits=len(texts) - len(missing), misses=len(missing))
+
+    fresh = classify_fn([texts[i] for i in missing])
+
+    for i, p in zip(missing, fresh):
+        probs[i] = p
+    with stage("neardup_insert"):
+        score_index.add_many([texts[i] for i in missing], fresh, generation)
 
-    if label.startswith("ai"):
-        return score
-    else:
-        return 1 - score
+    return probs
 
 
 # =========================
 # Endpoint
 # =========================
-@app.post("/detect", response_model=DetectResponse)
-def detect(req: DetectRequest):
-    text = req.text.strip()
-    lines = list(split_lines_with_offsets(text))
+class Item(NamedTuple):
+    """
+    One unit sent to the model: a whole segment, or a window of one.
+    """
+    segment: int
+    text: str        # raw text to clean and classify
+    tokens: int      # weight when averaging windows back into their segment
+    start: int       # reported span, windows don't overlap each other
+    end: int
+    display: str
 
-    if not lines:
-        return {"lines": []}
 
-    cleaned = [clean_text(l[0]) for l in lines]
-    outputs = classifier(cleaned)
+def expand_segments(text: str, lines, tokenizer) -> List[Item]:
+    items = []
 
-    results = []
+    for idx, (line, start, end) in enumerate(lines):
+        # A token spans at least one character, so shorter lines always fit
+        windows = token_windows(line, tokenizer, WINDOW_TOKENS, WINDOW_STRIDE) \
+            if len(line) > WINDOW_TOKENS else []
+
+        if len(windows) <= 1:
+            items.append(Item(idx, line, 1, start, end, line))
+            continue
 
-    for (line, start, end), out in zip(lines, outputs):
-        if not is_ai(out):
-            continue  # ✅ only return AI-highlighted lines
+        raw = text[start:end]
+        line_start = start + len(raw) - len(raw.lstrip())
+        for ws, we, cs, ce, tokens in windows:
+            items.append(Item(
+                idx, line[ws:we], tokens,
+                line_start + cs, line_start + ce, line[cs:ce]
+            ))
 
+    return items
+
+
+def segment_probs(count: int, items: List[Item], probs) -> List[float]:
+    """
+    One probability per segment: the token-weighted mean of its windows.
+    """
+    totals = [0.0] * count
+    weights = [0] * count
+    for item, prob in zip(items, probs):
+        totals[item.segment] += prob * item.tokens
+        weights[item.segment] += item.tokens
+
+    return [t / w for t, w in zip(totals, weights)]
+
+
+def collect_lines(lines, items: List[Item], probs, mode: str) -> List[dict]:
+    if mode == "spans":
+        return build_lines([(i.display, i.start, i.end) for i in items], probs)
+
+    return build_lines(lines, segment_probs(len(lines), items, probs))
+
+
+def build_lines(lines, probs) -> List[dict]:
+    probs = np.asarray(probs, dtype=np.float64)
+    # ✅ only return AI-highlighted lines
+    flagged = np.flatnonzero(probs > AI_THRESHOLD)
+    confidences = np.round(probs[flagged], 4).tolist()
+
+    results = []
+    for i, confidence in zip(flagged.tolist(), confidences):
+        line, start, end = lines[i]
         results.append({
             "text": line,
             "start": start,
             "end": end,
-            "confidence": round(ai_probability(out), 4)
+            "confidence": confidence
         })
 
-    return {"lines": results}
\ No newline at end of file
+    return results
+
+
+@app.post("/detect", response_model=DetectResponse, response_model_exclude_none=True)
+def detect(req: DetectRequest, x_admin_token: Optional[str] = Header(None)):
+    if req.profile:
+        require_admin(x_admin_token)
+        return detect_profiled(req.text, req.windows)
+
+    text = req.text.strip()
+    lines = list(split_lines_with_offsets(text))
+
+    if req.mode == "estimate":
+        return detect_estimate(text, lines, req)
+
+    if not lines:
+        return {"lines": []}
+
+    items = expand_segments(text, lines, registry.current.classifier.tokenizer)
+    cleaned = [clean_text(item.text) for item in items]
+    probs = classify_cached(cleaned)
+
+    return {"lines": collect_lines(lines, items, probs, req.windows)}
+
+
+def detect_profiled(text: str, windows: str) -> dict:
+    """
+    Same work as detect, with every stage timed. The model runs through
+    DirectClassifier with a timer, so tokenization and each batch's
+    padding and forward pass show up separately.
+    """
+    timer = StageTimer()
+    handle = registry.current
+
+    text = text.strip()
+
+    with timer.stage("segmentation") as info:
+        lines = list(split_lines_with_offsets(text))
+        items = expand_segments(text, lines, handle.classifier.tokenizer)
+        info.update(segments=len(lines), items=len(items))
+
+    with timer.stage("cleaning"):
+        cleaned = [clean_text(item.text) for item in items]
+
+    probs = classify_cached(cleaned, lambda texts: profile_classify(handle, texts, timer), timer)
+
+    with timer.stage("results"):
+        results = collect_lines(lines, items, probs, windows)
+
+    with timer.stage("serialization"):
+        json.dumps(results)
+
+    return {"lines": results, "profile": timer.summary(model=handle.describe())}
+
+
+def detect_estimate(text: str, lines, req: DetectRequest) -> dict:
+    """
+    Score a stratified sample of segments and estimate the AI coverage
+    percentage, adding Neyman-allocated rounds while the interval is wider
+    than target_width and the time budget allows.
+    """
+    if not 0.0 < req.confidence < 1.0:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+
+    started = time.perf_counter()
+    tokenizer = registry.current.classifier.tokenizer
+    estimator = StratifiedEstimator(
+        [end - start for _, start, end in lines], len(text), strata=ESTIMATE_STRATA
+    )
+
+    results = []
+    rounds = 0
+    batch = estimator.next_batch(max(1, req.sample_size))
+
+    while batch:
+        sample = [lines[i] for i in batch]
+        items = expand_segments(text, sample, tokenizer)
+        probs = segment_probs(len(sample), items, classify_cached([clean_text(item.text) for item in items]))
+
+        estimator.record(batch, [p > AI_THRESHOLD for p in probs])
+        results += build_lines(sample, probs)
+        rounds += 1
+
+        estimate = estimator.estimate(req.confidence)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if req.target_width is not None:
+            if estimate["ci_high"] - estimate["ci_low"] <= req.target_width:
+                break
+        elif req.time_budget_ms is None:
+            break
+        if req.time_budget_ms is not None and elapsed_ms >= req.time_budget_ms:
+            break
+        batch = estimator.next_batch(ESTIMATE_ROUND_SIZE)
+
+    estimate = estimator.estimate(req.confidence)
+    estimate.update(rounds=rounds, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+
+    results.sort(key=lambda r: r["start"])
+    return {"lines": results, "estimate": estimate}
+
+
+@app.post("/rephrase", response_model=RephraseResponse)
+def rephrase(req: RephraseRequest):
+    """
+    Humanize the text, re-checking it with the classifier and reworking only
+    the sentences that are still flagged.
+    """
+    try:
+        return rephrase_until_human(
+            req.text,
+            classify,
+            p_syn=req.p_syn,
+            p_trans=req.p_trans,
+            threshold=req.threshold,
+            max_iterations=req.max_iterations,
+            time_budget_ms=req.time_budget_ms
+        )
+    except (ImportError, LookupError) as e:
+        # LookupError: NLTK data or the spaCy model is not installed
+        raise HTTPException(
+            status_code=503,
+            detail=f"Humanizer unavailable ({e}); see HUMANIZER_DIR and requirements-humanizer.txt"
+        )
+
+
+# =========================
+# Jobs
+# =========================
+def detect_job(payload: dict, ctx) -> dict:
+    """
+    /detect in chunks of JOB_CHUNK_SEGMENTS segments, saving the lines found
+    so far after each chunk so a restarted job continues where it stopped.
+    """
+    text = payload["text"].strip()
+    lines = list(split_lines_with_offsets(text))
+    partial = ctx.partial or {"lines": [], "segments_done": 0}
+    results, done = partial["lines"], partial["segments_done"]
+    ctx.progress(done, len(lines))
+
+    tokenizer = registry.current.classifier.tokenizer
+    while done < len(lines):
+        chunk = lines[done:done + JOB_CHUNK_SEGMENTS]
+        items = expand_segments(text, chunk, tokenizer)
+        probs = classify_cached([clean_text(item.text) for item in items])
+        results += collect_lines(chunk, items, probs, payload["windows"])
+        done += len(chunk)
+        ctx.progress(done, len(lines), {"lines": results, "segments_done": done})
+
+    return {"lines": results}
+
+
+def rephrase_job(payload: dict, ctx) -> dict:
+    """
+    /rephrase as a job. Progress is saved after every ROUND_CHUNK reworked
+    sentences, so it shows, can be cancelled and resumes within a round.
+    """
+    return rephrase_until_human(
+        payload["text"],
+        classify,
+        p_syn=payload["p_syn"],
+        p_trans=payload["p_trans"],
+        threshold=payload["threshold"],
+        max_iterations=payload["max_iterations"],
+        time_budget_ms=payload["time_budget_ms"],
+        on_progress=ctx.progress,
+        resume=ctx.partial
+    )
+
+
+jobs.register("detect", detect_job)
+jobs.register("rephrase", rephrase_job)
+
+
+@app.post("/jobs/detect", status_code=202, response_model=JobSubmitted)
+def submit_detect(req: DetectJobRequest):
+    return {"id": jobs.submit("detect", req.model_dump()), "status": "queued"}
+
+
+@app.post("/jobs/rephrase", status_code=202, response_model=JobSubmitted)
+def submit_rephrase(req: RephraseRequest):
+    return {"id": jobs.submit("rephrase", req.model_dump()), "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    status = jobs.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if status in (DONE, FAILED):
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+    return jobs.get(job_id)
+
+
+@app.get("/stats/jobs")
+def job_stats():
+    return jobs.stats()
+
+
+@app.get("/stats/neardup")
+def neardup_stats():
+    if score_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **score_index.stats()}
+
+
+# =========================
+# Admin
+# =========================
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/admin/model", dependencies=[Depends(require_admin)])
+def model_status():
+    return registry.status()
+
+
+@app.post("/admin/model", status_code=202, dependencies=[Depends(require_admin)])
+def load_model(req: ModelLoadRequest):
+    if not 0.0 <= req.shadow_fraction <= 1.0:
+        raise HTTPException(status_code=400, detail="shadow_fraction must be between 0 and 1")
+    if not registry.load_async(req.model, req.revision, req.shadow_fraction):
+        raise HTTPException(status_code=409, detail="A model is already loading")
+    return registry.status()
+
+
+@app.post("/admin/model/promote", dependencies=[Depends(require_admin)])
+def promote_model():
+    if not registry.promote():
+        raise HTTPException(status_code=404, detail="No candidate model loaded")
+    return registry.status()
+
+
+@app.delete("/admin/model/candidate", dependencies=[Depends(require_admin)])
+def discard_model():
+    if not registry.discard_candidate():
+        raise HTTPException(status_code=404, detail="No candidate model loaded")
+    return registry.status()
@@ -0,0 +1,123 @@
+import math
+import random
+from statistics import NormalDist
+from typing import List, Optional
+
+# Floor on a stratum's standard deviation, relative to its prior, so a
+# stratum that looked uniform in a small sample still gets refined
+MIN_SPREAD = 0.1
+
+
+class StratifiedEstimator:
+    """
+    Estimates the share of a document's characters covered by AI-flagged
+    segments from a sample of its segments.
+
+    Segments are split into equal-count strata by length: long segments
+    weigh more in the coverage and vary more, so they get sampled more.
+    Each sampled segment contributes its length if flagged, else 0. The
+    stratified variance includes the finite population correction, so once
+    every segment is sampled the estimate is exact with zero width.
+    """
+
+    def __init__(self, lengths: List[int], total_length: int, strata: int = 4, seed: Optional[int] = None):
+        self.lengths = lengths
+        self.total_length = total_length
+        self.stratum_of = [0] * len(lengths)
+        rng = random.Random(seed)
+
+        order = sorted(range(len(lengths)), key=lengths.__getitem__)
+        count = min(strata, len(order))
+        bounds = [round(k * len(order) / count) for k in range(count + 1)] if count else []
+
+        self.strata = []
+        for h, (a, b) in enumerate(zip(bounds, bounds[1:])):
+            members = order[a:b]
+            rng.shuffle(members)
+            for i in members:
+                self.stratum_of[i] = h
+            self.strata.append({
+                "size": len(members),
+                "pending": members,
+                "values": [],
+                # Largest possible spread of length * Bernoulli in this stratum
+                "prior_sd": sum(lengths[i] for i in members) / len(members) / 2,
+            })
+
+    @property
+    def sampled(self) -> int:
+        return sum(len(s["values"]) for s in self.strata)
+
+    @property
+    def exhausted(self) -> bool:
+        return not any(s["pending"] for s in self.strata)
+
+    def _sd(self, stratum: dict) -> float:
+        values = stratum["values"]
+        if len(values) < 2:
+            return stratum["prior_sd"]
+        mean = sum(values) / len(values)
+        var = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+        return max(math.sqrt(var), stratum["prior_sd"] * MIN_SPREAD)
+
+    def _take(self, stratum: dict, n: int) -> List[int]:
+        picked, stratum["pending"] = stratum["pending"][:n], stratum["pending"][n:]
+        return picked
+
+    def next_batch(self, size: int) -> List[int]:
+        """
+        Pick up to `size` unsampled segments. Strata with fewer than two
+        samples are filled first, the rest goes to strata in proportion to
+        N_h * S_h (Neyman allocation).
+        """
+        picks = []
+        for s in self.strata:
+            picks += self._take(s, min(max(0, 2 - len(s["values"])), size - len(picks)))
+
+        while len(picks) < size and not self.exhausted:
+            open_strata = [s for s in self.strata if s["pending"]]
+            weights = [s["size"] * self._sd(s) for s in open_strata]
+            total = sum(weights)
+            room = size - len(picks)
+            for s, w in zip(open_strata, weights):
+                share = max(1, round(room * w / total)) if total else 1
+                picks += self._take(s, min(share, size - len(picks)))
+                if len(picks) >= size:
+                    break
+
+        return picks
+
+    def record(self, indices: List[int], flagged: List[bool]):
+        for i, is_ai in zip(indices, flagged):
+            self.strata[self.stratum_of[i]]["values"].append(self.lengths[i] if is_ai else 0)
+
+    def estimate(self, confidence: float = 0.95) -> dict:
+        total = 0.0
+        variance = 0.0
+        for s in self.strata:
+            n, size = len(s["values"]), s["size"]
+            if n == 0:
+                # Nothing known yet: anywhere between none and all of it
+                total += size * s["prior_sd"]
+                variance += (size * s["prior_sd"]) ** 2
+                continue
+            total += size * sum(s["values"]) / n
+            variance += size ** 2 * (1 - n / size) * self._sd(s) ** 2 / n
+
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        scale = 100 / self.total_length if self.total_length else 0.0
+        pct = total * scale
+        half = z * math.sqrt(variance) * scale
+
+        def clamp(x):
+            return round(min(100.0, max(0.0, x)), 2)
+
+        return {
+            "ai_percentage": clamp(pct),
+            "ci_low": clamp(pct - half),
+            "ci_high": clamp(pct + half),
+            "confidence": confidence,
+            "sampled": self.sampled,
+            "segments": len(self.lengths),
+            "exact": self.exhausted,
+        }
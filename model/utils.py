@@ -1,5 +1,9 @@
+import csv
+import json
 import re
 from html import unescape
+from pathlib import Path
+from typing import Iterator, Tuple
 
 
 def clean_text(t):
@@ -38,4 +42,77 @@ def clean_markdown(md_text):
     md_text = re.sub(r'<.*?>', '', md_text)
     # Decode HTML entities
     md_text = unescape(md_text)
-    return md_text
\ No newline at end of file
+    return md_text
+
+
+def split_lines_with_offsets(text: str):
+    pattern = re.compile(r'[^.!?]+[.!?]?', re.MULTILINE)
+    for m in pattern.finditer(text):
+        s = m.group().strip()
+        if s:
+            yield s, m.start(), m.end()
+
+
+def iter_documents(path: Path) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (source, text) from a directory of .txt/.md files, a JSONL file or
+    a CSV file. JSONL and CSV rows need a `text` field and may carry `id`.
+    """
+    if path.is_dir():
+        for p in sorted(path.rglob("*")):
+            if p.suffix.lower() in (".txt", ".md"):
+                yield str(p), p.read_text(encoding="utf-8", errors="ignore")
+    elif path.suffix.lower() == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                if line.strip():
+                    row = json.loads(line)
+                    yield f"{path}:{row.get('id', n)}", row["text"]
+    elif path.suffix.lower() == ".csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            for n, row in enumerate(csv.DictReader(f)):
+                yield f"{path}:{row.get('id') or n}", row["text"]
+    else:
+        yield str(path), path.read_text(encoding="utf-8", errors="ignore")
+
+
+def token_windows(text: str, tokenizer, size: int, stride: int):
+    """
+    Split text into windows of at most `size` tokens, each overlapping the
+    previous one by `stride` tokens, using the fast tokenizer's offsets.
+
+    Returns (start, end, core_start, core_end, tokens) per window as
+    character offsets into `text`. start/end is the span to classify;
+    the core spans split the overlaps at their midpoint so they tile the
+    text without overlapping.
+    """
+    if not 0 <= stride < size:
+        raise ValueError(f"stride must satisfy 0 <= stride < size, got stride={stride}, size={size}")
+
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    n = len(offsets)
+    if n <= size:
+        return [(0, len(text), 0, len(text), n)]
+
+    bounds = []
+    a = 0
+    while True:
+        b = min(a + size, n)
+        bounds.append((a, b))
+        if b == n:
+            break
+        a += size - stride
+
+    cores = [0] + [(a + prev_b) // 2 for (a, _), (_, prev_b) in zip(bounds[1:], bounds)] + [n]
+
+    windows = []
+    for k, (a, b) in enumerate(bounds):
+        ca, cb = cores[k], cores[k + 1]
+        windows.append((
+            offsets[a][0],
+            offsets[b - 1][1],
+            0 if k == 0 else offsets[ca][0],
+            len(text) if k == len(bounds) - 1 else offsets[cb - 1][1],
+            b - a,
+        ))
+    return windows